@@ -2,6 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib import messages, auth
 from django.contrib.auth.models import User
 from contacts.models import Contact
+from listings.paginator import KeysetPaginator
 # Create your views here.
 def register(request):
     if request.method == "POST":
@@ -51,8 +52,9 @@ def logout(request):
     return redirect('pages:index')
 
 def dashboard(request):
-    user_contacts = Contact.objects.filter(user_id=request.user.id).order_by('-contact_date')
-    context = {"contacts":user_contacts}
+    user_contacts = Contact.objects.filter(user_id=request.user.id).order_by('-contact_date', '-id')
+    paginator = KeysetPaginator(user_contacts, 10)
+    context = {"contacts":paginator.get_page(request.GET.get('cursor'))}
     return render(request, 'accounts/dashboard.html', context)
 
 
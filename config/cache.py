@@ -0,0 +1,222 @@
+"""Two-tier cache backend: a bounded in-process LRU in front of a shared cache.
+
+Only keys under one of ``LOCAL_PREFIXES`` are kept locally; everything else
+(counters, locks, the data version itself) goes straight to the shared tier.
+Each prefix is a namespace with a version counter in the shared tier. A delete
+bumps its namespace version, and a process re-reads the versions at most every
+``CHECK_INTERVAL`` seconds, dropping local copies made under an older one, so
+other processes see a deletion within that interval. Writes do not bump: the
+locally kept keys already embed a data version (template fragments, cached
+search results, page HTML), so a new value is written under a new key, and
+every process keeps its local copies of the old ones until they age out.
+A key that is overwritten in place must not be under a local prefix, or other
+processes serve the old value for up to ``LOCAL_TIMEOUT``.
+
+The namespace versions are counters in the shared tier, so it needs an atomic
+``incr``/``add`` (Redis, Memcached) whenever more than one process writes.
+
+OPTIONS:
+    SHARED           alias of the shared cache in CACHES
+    LOCAL_PREFIXES   key prefixes served from the local tier
+    MAX_ENTRIES      local entries kept (least recently used evicted first)
+    MAX_BYTES        pickled size of the local tier
+    LOCAL_TIMEOUT    seconds a local copy may live
+    CHECK_INTERVAL   seconds between namespace version checks
+"""
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+NAMESPACE_KEY = 'twotier:ns:%s'
+MISSING = object()
+
+# Django builds a cache object per thread; the local tier is shared by all of
+# them, one per LOCATION, like LocMemCache does.
+_tiers = {}
+_tiers_lock = threading.Lock()
+
+
+class LocalTier:
+    def __init__(self):
+        self.entries = OrderedDict()   # local key -> (expires, namespace, namespace version, pickled value)
+        self.bytes = 0
+        self.versions = {}             # namespace -> (version, checked at)
+        self.lock = threading.RLock()
+        self.hits = self.misses = 0
+
+
+class TwoTierCache(BaseCache):
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED', 'shared')
+        self.prefixes = tuple(options.get('LOCAL_PREFIXES', ()))
+        self.max_bytes = options.get('MAX_BYTES', 8 * 1024 * 1024)
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 30)
+        self.check_interval = options.get('CHECK_INTERVAL', 1)
+        with _tiers_lock:
+            self.tier = _tiers.setdefault(location, LocalTier())
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    def namespace(self, key):
+        for prefix in self.prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return None
+
+    # namespace versions
+
+    def namespace_version(self, namespace):
+        now = time.monotonic()
+        with self.tier.lock:
+            version, checked = self.tier.versions.get(namespace, (None, 0))
+        if version is None or now - checked > self.check_interval:
+            version = self.shared.get(NAMESPACE_KEY % namespace)
+            if version is None:
+                self.shared.add(NAMESPACE_KEY % namespace, 0, None)
+                version = self.shared.get(NAMESPACE_KEY % namespace, 0)
+            with self.tier.lock:
+                self.tier.versions[namespace] = (version, now)
+        return version
+
+    def bump_namespace(self, namespace):
+        key = NAMESPACE_KEY % namespace
+        try:
+            version = self.shared.incr(key)
+        except ValueError:
+            self.shared.add(key, 0, None)
+            version = self.shared.incr(key)
+        with self.tier.lock:
+            self.tier.versions[namespace] = (version, time.monotonic())
+        return version
+
+    # local tier
+
+    def _drop(self, local_key):
+        entry = self.tier.entries.pop(local_key, None)
+        if entry is not None:
+            self.tier.bytes -= len(entry[3])
+
+    def _store(self, local_key, namespace, version, value, timeout):
+        if timeout is not None and timeout <= 0:
+            return
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes // 8:
+            return  # one large value should not flush the whole tier
+        ttl = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        with self.tier.lock:
+            self._drop(local_key)
+            self.tier.entries[local_key] = (time.monotonic() + ttl, namespace, version, data)
+            self.tier.bytes += len(data)
+            while self.tier.entries and (len(self.tier.entries) > self._max_entries or self.tier.bytes > self.max_bytes):
+                _, entry = self.tier.entries.popitem(last=False)
+                self.tier.bytes -= len(entry[3])
+
+    def _local_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    # cache API
+
+    def get(self, key, default=None, version=None):
+        namespace = self.namespace(key)
+        if namespace is None:
+            return self.shared.get(key, default, version=version)
+        local_key = self.make_and_validate_key(key, version=version)
+        current = self.namespace_version(namespace)
+        with self.tier.lock:
+            entry = self.tier.entries.get(local_key)
+            if entry is not None:
+                expires, _, entry_version, data = entry
+                if expires > time.monotonic() and entry_version == current:
+                    self.tier.entries.move_to_end(local_key)
+                    self.tier.hits += 1
+                    return pickle.loads(data)
+                self._drop(local_key)
+            self.tier.misses += 1
+        value = self.shared.get(key, MISSING, version=version)
+        if value is MISSING:
+            return default
+        self._store(local_key, namespace, current, value, None)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self.shared.set(key, value, timeout, version=version)
+        self._written(key, version, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        added = self.shared.add(key, value, timeout, version=version)
+        if added:
+            self._written(key, version, value, timeout)
+        return added
+
+    def _written(self, key, version, value, timeout):
+        namespace = self.namespace(key)
+        if namespace is not None:
+            self._store(self.make_and_validate_key(key, version=version), namespace,
+                        self.namespace_version(namespace), value, self._local_timeout(timeout))
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        failed = self.shared.set_many(data, timeout, version=version)
+        for key, value in data.items():
+            if key not in failed:
+                self._written(key, version, value, timeout)
+        return failed
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        return self.shared.touch(key, timeout, version=version)
+
+    def delete(self, key, version=None):
+        deleted = self.shared.delete(key, version=version)
+        self._forget([key], version)
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        self.shared.delete_many(keys, version=version)
+        self._forget(keys, version)
+
+    def _forget(self, keys, version):
+        namespaces = set()
+        with self.tier.lock:
+            for key in keys:
+                namespace = self.namespace(key)
+                if namespace is not None:
+                    self._drop(self.make_and_validate_key(key, version=version))
+                    namespaces.add(namespace)
+        for namespace in namespaces:
+            self.bump_namespace(namespace)
+
+    def has_key(self, key, version=None):
+        if self.namespace(key) is None:
+            return self.shared.has_key(key, version=version)
+        return self.get(key, MISSING, version=version) is not MISSING
+
+    def incr(self, key, delta=1, version=None):
+        value = self.shared.incr(key, delta, version=version)
+        if self.namespace(key) is not None:
+            # a counter changes in place, so it is only ever read from the shared tier
+            with self.tier.lock:
+                self._drop(self.make_and_validate_key(key, version=version))
+        return value
+
+    def clear(self):
+        self.shared.clear()
+        with self.tier.lock:
+            self.tier.entries.clear()
+            self.tier.versions.clear()
+            self.tier.bytes = 0
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
+
+    def stats(self):
+        with self.tier.lock:
+            return {'entries': len(self.tier.entries), 'bytes': self.tier.bytes, 'hits': self.tier.hits, 'misses': self.tier.misses,
+                    'namespaces': {namespace: version for namespace, (version, _) in self.tier.versions.items()}}
@@ -50,7 +50,8 @@ INSTALLED_APPS = [
     'listings.apps.ListingsConfig',
     'doctors.apps.DoctorsConfig',
     'accounts.apps.AccountsConfig',
-    'contacts.apps.ContactsConfig'
+    'contacts.apps.ContactsConfig',
+    'images.apps.ImagesConfig',
 ]
 
 MIDDLEWARE = [
@@ -61,6 +62,8 @@ MIDDLEWARE = [
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
+    'pages.microcache.MicroCacheMiddleware',
+    'pages.middleware.HolePunchedCacheMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
@@ -98,6 +101,38 @@ DATABASES = {
     }
 }
 
+# Cache
+# The shared tier holds the data versions and the two-tier namespace counters,
+# which need an atomic incr/add. Set REDIS_URL in production (several workers,
+# several hosts). Without it the shared tier is file based, which only suits a
+# single process such as runserver: its incr reads and rewrites the file, so
+# concurrent bumps can be lost.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'config.cache.TwoTierCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            # read on every request and never overwritten in place: fragments, search results and page
+            # HTML embed a data version, image metadata and srcsets are deleted when they change
+            'LOCAL_PREFIXES': ['template.cache.', 'listings:search:', 'pages:page:', 'images:'],
+            'MAX_ENTRIES': 2000,
+            'MAX_BYTES': 16 * 1024 * 1024,
+            'LOCAL_TIMEOUT': 30,
+            'CHECK_INTERVAL': 1,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.getenv('REDIS_URL'),
+    } if os.getenv('REDIS_URL') else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.cache'),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -147,6 +182,22 @@ INTERNAL_IPS = ['127.0.0.1',]
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# media is served by images.views.serve; behind nginx set 'x-accel-redirect' (with an
+# internal location at MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT), behind Apache 'x-sendfile'
+MEDIA_SENDFILE = os.getenv('MEDIA_SENDFILE', '')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+
+# uploaded photos are stored once per content (see images.storage)
+STORAGES = {
+    'default': {
+        'BACKEND': 'images.storage.ContentAddressedStorage',
+        'OPTIONS': {'hashed_prefixes': ['photos/', 'doctors/']},
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 TAGGIT_CASE_INSENSITIVE = True
 
 MESSAGE_TAGS = {
@@ -0,0 +1,23 @@
+"""Settings the test cases override, so a test run never touches the real caches."""
+
+CACHES = {
+    'default': {
+        'BACKEND': 'config.cache.TwoTierCache',
+        'LOCATION': 'tests',
+        'OPTIONS': {
+            'SHARED': 'shared',
+            'LOCAL_PREFIXES': ['template.cache.', 'listings:search:', 'pages:page:', 'images:'],
+            'CHECK_INTERVAL': 0,
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'tests-shared',
+    },
+}
+
+
+def file_caches(location):
+    """CACHES with settings.py's fallback shared tier, a FileBasedCache in ``location``."""
+    shared = {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location}
+    return {**CACHES, 'shared': shared}
@@ -0,0 +1,124 @@
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+from config import testing
+from config.cache import NAMESPACE_KEY, TwoTierCache
+
+
+def process(location, **options):
+    """A TwoTierCache as another worker process would build it: its own local tier, the same shared tier."""
+    options = {'SHARED': 'shared', 'LOCAL_PREFIXES': ['local:'], 'CHECK_INTERVAL': 0, 'LOCAL_TIMEOUT': 30, **options}
+    return TwoTierCache(location, {'OPTIONS': options})
+
+
+@override_settings(CACHES=testing.CACHES)
+class TwoTierCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches['shared'].clear()
+        # local tiers live per location for the whole run, so every test gets its own
+        self.first, self.second = self.process('first'), self.process('second')
+        for cache in (self.first, self.second):
+            cache.clear()
+
+    def process(self, name, **options):
+        return process('%s:%s' % (self.id(), name), **options)
+
+    def test_local_keys_are_served_from_the_process(self):
+        self.first.set('local:a', 1)
+        caches['shared'].delete('local:a')
+        self.assertEqual(self.first.get('local:a'), 1)
+        self.assertIsNone(self.second.get('local:a'))
+        self.assertEqual(self.first.stats()['hits'], 1)
+
+    def test_other_keys_only_live_in_the_shared_tier(self):
+        self.first.set('counter', 1)
+        caches['shared'].delete('counter')
+        self.assertIsNone(self.first.get('counter'))
+        self.assertEqual(self.first.stats()['entries'], 0)
+
+    def test_writes_do_not_invalidate_other_processes(self):
+        self.second.set('local:b', 'cached')
+        self.assertEqual(self.second.get('local:b'), 'cached')
+        before = caches['shared'].get(NAMESPACE_KEY % 'local:')
+        self.first.set('local:a', 1)
+        self.first.set_many({'local:c': 2, 'local:d': 3})
+        self.first.add('local:e', 4)
+        self.assertEqual(caches['shared'].get(NAMESPACE_KEY % 'local:'), before)
+        self.assertEqual(self.second.get('local:b'), 'cached')
+        self.assertEqual(self.second.stats()['hits'], 2)
+
+    def test_delete_reaches_other_processes(self):
+        self.first.set('local:a', 1)
+        self.assertEqual(self.second.get('local:a'), 1)
+        self.first.delete('local:a')
+        self.assertIsNone(self.second.get('local:a'))
+        self.first.set('local:b', 2)
+        self.assertEqual(self.second.get('local:b'), 2)
+        self.second.delete_many(['local:b'])
+        self.assertIsNone(self.first.get('local:b'))
+
+    def test_namespace_version_is_rechecked_after_the_interval(self):
+        slow = self.process('slow', CHECK_INTERVAL=60)
+        slow.clear()
+        slow.set('local:a', 1)
+        self.assertEqual(slow.get('local:a'), 1)
+        self.first.delete('local:a')
+        caches['shared'].set('local:a', 2)
+        self.assertEqual(slow.get('local:a'), 1)  # still within the interval
+        with mock.patch('config.cache.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(slow.get('local:a'), 2)
+
+    def test_incr_is_not_kept_locally(self):
+        self.first.set('local:n', 1)
+        self.assertEqual(self.first.incr('local:n'), 2)
+        self.assertEqual(self.second.incr('local:n'), 3)
+        self.assertEqual(self.first.get('local:n'), 3)
+
+    def test_local_copy_expires(self):
+        short = self.process('short', LOCAL_TIMEOUT=5)
+        short.clear()
+        short.set('local:a', 1)
+        caches['shared'].set('local:a', 2)
+        self.assertEqual(short.get('local:a'), 1)
+        with mock.patch('config.cache.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(short.get('local:a'), 2)
+
+    def test_shorter_timeouts_bound_the_local_copy(self):
+        self.first.set('local:a', 1, 1)
+        self.first.set('local:b', 1, 0)
+        self.assertEqual(self.first.stats()['entries'], 1)
+        caches['shared'].set('local:a', 2)
+        with mock.patch('config.cache.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.first.get('local:a'), 2)
+
+    def test_entries_and_bytes_are_bounded(self):
+        small = self.process('small', MAX_ENTRIES=3, MAX_BYTES=8000)
+        small.clear()
+        for i in range(5):
+            small.set('local:%d' % i, i)
+        self.assertEqual(small.stats()['entries'], 3)
+        small.set('local:big', 'x' * 2000)  # over an eighth of MAX_BYTES
+        self.assertLessEqual(small.stats()['bytes'], 8000)
+        self.assertEqual(small.stats()['entries'], 3)
+        self.assertEqual(small.get('local:big'), 'x' * 2000)
+
+
+class FileSharedTierTests(TwoTierCacheTests):
+    """The same behaviour over a FileBasedCache shared tier, the default without REDIS_URL."""
+
+    def setUp(self):
+        location = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, location, ignore_errors=True)
+        self.enterContext(override_settings(CACHES=testing.file_caches(location)))
+        super().setUp()
+
+    def test_shared_tier_is_on_disk(self):
+        self.assertEqual(type(caches['shared']).__name__, 'FileBasedCache')
+        self.first.set('local:a', 1)
+        self.assertEqual(caches['shared'].get('local:a'), 1)
+        self.assertTrue(any(name.endswith('.djcache') for name in os.listdir(caches['shared']._dir)))
@@ -14,11 +14,13 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from debug_toolbar.toolbar import debug_toolbar_urls
 from django.conf import settings
-from django.conf.urls.static import static
+from images.views import serve as serve_media
 
 urlpatterns = [
     path('',include("pages.urls", namespace="pages")),
@@ -26,7 +28,8 @@ urlpatterns = [
     path('contacts/', include("contacts.urls", namespace="contacts")),
     path('accounts/', include("accounts.urls", namespace="accounts")),
     path('admin/', admin.site.urls),
-] + debug_toolbar_urls() + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+    re_path(r'^%s(?P<name>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+] + debug_toolbar_urls()
 
 admin.site.site_header = "Medical Center Admin"
 admin.site.site_title = "Medical Center Admin Portal"
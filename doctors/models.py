@@ -9,6 +9,7 @@ class Doctor(models.Model):
     email = models.EmailField(max_length=50, unique=True, blank=False)
     is_mvp = models.BooleanField(default=True)
     hire_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True) # version stamp for conditional GETs
     def __str__(self):
         return self.name
 
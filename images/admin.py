@@ -0,0 +1,30 @@
+from django.contrib import admin
+from .models import Derivative, ImageJob, ImageMeta
+# Register your models here.
+class DerivativeAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source_name', 'format', 'width', 'height', 'bytes', 'created')
+    list_display_links = ('id', 'source_name')
+    list_filter = ('format', 'width')
+    search_fields = ('source_name', 'source_hash')
+    list_per_page = 25
+
+admin.site.register(Derivative, DerivativeAdmin)
+
+class ImageJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source_name', 'status', 'attempts', 'run_after', 'updated')
+    list_display_links = ('id', 'source_name')
+    list_filter = ('status',)
+    search_fields = ('source_name', 'source_hash')
+    readonly_fields = ('source_hash', 'locked_at', 'last_error', 'created', 'updated')
+    list_per_page = 25
+
+admin.site.register(ImageJob, ImageJobAdmin)
+
+class ImageMetaAdmin(admin.ModelAdmin):
+    list_display = ('id', 'source_name', 'width', 'height', 'bytes', 'created')
+    list_display_links = ('id', 'source_name')
+    search_fields = ('source_name', 'sha256')
+    readonly_fields = ('placeholder',)
+    list_per_page = 25
+
+admin.site.register(ImageMeta, ImageMetaAdmin)
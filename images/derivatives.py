@@ -0,0 +1,196 @@
+"""Resized WebP / AVIF copies of listing and doctor photos.
+
+Every source image gets one file per width in WIDTHS (never upscaled) and per
+format Pillow can write. Files are named after the SHA-256 of the source
+content and the encoder settings, so the same photo uploaded twice is
+encoded once, and neither a replaced photo nor a change to QUALITY can be
+served from a stale browser or CDN copy.
+
+Saves only queue an ImageJob; the image_worker command does the encoding in
+a process pool (see images.jobs), ``generate`` does it inline.
+``srcsets(name)`` is what templates use (see images.templatetags.images); it
+is cached per source and dropped whenever that source is regenerated.
+"""
+import hashlib
+import io
+import logging
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps, UnidentifiedImageError, features
+
+logger = logging.getLogger(__name__)
+
+WIDTHS = (320, 640, 1280)
+FORMATS = ('avif', 'webp') if features.check('avif') else ('webp',)
+QUALITY = {'webp': 80, 'avif': 60}
+CONTENT_TYPES = {'webp': 'image/webp', 'avif': 'image/avif'}
+RESAMPLE = Image.Resampling.LANCZOS
+
+# model -> image fields that get derivatives
+SOURCES = {
+    'listings.Listing': ('photo_main', 'photo_1', 'photo_2', 'photo_3', 'photo_4', 'photo_5', 'photo_6'),
+    'doctors.Doctor': ('photo',),
+}
+
+DIRECTORY = 'derivatives'
+SRCSET_KEY = 'images:srcset:%s'
+CHUNK_SIZE = 64 * 1024
+
+
+def content_hash(name):
+    digest = hashlib.sha256()
+    with default_storage.open(name, 'rb') as source:
+        for chunk in iter(lambda: source.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def source_names():
+    """Every stored file referenced by one of the SOURCES fields."""
+    from django.apps import apps
+
+    names = set()
+    for label, fields in SOURCES.items():
+        model = apps.get_model(label)
+        for field in fields:
+            names.update(model.objects.exclude(**{field: ''}).values_list(field, flat=True).distinct())
+    return sorted(names)
+
+
+def rename_source(name, new_name):
+    """Point every field holding ``name`` at ``new_name``.
+
+    Rows are saved one by one so cards, caches, metadata and derivative jobs
+    follow, as after an edit in the admin.
+    """
+    from django.apps import apps
+
+    for label, fields in SOURCES.items():
+        model = apps.get_model(label)
+        for field in fields:
+            for instance in model.objects.filter(**{field: name}):
+                getattr(instance, field).name = new_name
+                instance.save()
+
+
+def encoder_params(format):
+    return {'quality': QUALITY[format]}
+
+
+def encoder_tag(format):
+    """Short hash of everything besides the source that shapes the encoded bytes."""
+    settings = (format, sorted(encoder_params(format).items()), RESAMPLE.name)
+    return hashlib.sha256(repr(settings).encode()).hexdigest()[:8]
+
+
+def derivative_name(digest, width, format):
+    # served as immutable, so the name changes with anything that changes the bytes
+    return '%s/%s/%s-%d-%s.%s' % (DIRECTORY, digest[:2], digest[:32], width, encoder_tag(format), format)
+
+
+def srcset_key(name):
+    return SRCSET_KEY % hashlib.md5(name.encode()).hexdigest()
+
+
+def target_widths(width):
+    # the largest variant is the source width itself when it falls below the top step
+    return sorted({target for target in WIDTHS if target < width} | {min(width, WIDTHS[-1])})
+
+
+def encode(image, format):
+    buffer = io.BytesIO()
+    image.save(buffer, format.upper(), **encoder_params(format))
+    return buffer.getvalue()
+
+
+def render(name, known_hash=None):
+    """Encode the derivatives of the stored file ``name`` into storage.
+
+    Returns ``(digest, rows)`` with one ``(width, height, format, path, bytes)``
+    per file, or None when there is nothing to do: the file is gone, cannot be
+    read, or still hashes to ``known_hash``. Touches storage only, never the
+    database, so it can run in a worker process.
+    """
+    if not name or not default_storage.exists(name):
+        return None
+    digest = content_hash(name)
+    if digest == known_hash:
+        return None
+    try:
+        with default_storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            image.draft('RGB', (WIDTHS[-1], WIDTHS[-1]))  # JPEG decodes at a reduced scale directly
+            image = ImageOps.exif_transpose(image)
+            image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Cannot read %s for derivatives', name, exc_info=True)
+        return None
+    rows = []
+    # largest first, each step resized from the previous one
+    for width in sorted(target_widths(image.width), reverse=True):
+        height = max(1, round(image.height * width / image.width))
+        if width != image.width:
+            image = image.resize((width, height), RESAMPLE)
+        for format in FORMATS:
+            path = derivative_name(digest, width, format)
+            if default_storage.exists(path):
+                size = default_storage.size(path)
+            else:
+                data = encode(image, format)
+                default_storage.save(path, ContentFile(data))
+                size = len(data)
+            rows.append((width, height, format, path, size))
+    return digest, rows
+
+
+def known_hash(name):
+    """Content hash the current derivatives of ``name`` were built from, if any.
+
+    None as well when they were encoded with other settings, so they are rebuilt.
+    """
+    from images.models import Derivative
+
+    rows = Derivative.objects.filter(source_name=name).values_list('source_hash', 'width', 'format', 'name')
+    hashes = {digest for digest, width, format, path in rows}
+    if len(hashes) != 1 or any(path != derivative_name(*row) for *row, path in rows):
+        return None
+    return hashes.pop()
+
+
+def record(name, digest, rows):
+    from images.models import Derivative
+
+    with transaction.atomic():
+        Derivative.objects.filter(source_name=name).delete()
+        Derivative.objects.bulk_create(
+            Derivative(source_name=name, source_hash=digest, width=width, height=height, format=format, name=path, bytes=size)
+            for width, height, format, path, size in rows)
+    cache.delete(srcset_key(name))
+
+
+def generate(name):
+    """Create the derivatives of ``name`` in this process; returns True if anything changed."""
+    result = render(name, known_hash(name))
+    if result is None:
+        return False
+    record(name, *result)
+    return True
+
+
+def srcsets(name):
+    """``{format: 'url 320w, url 640w, ...'}`` for the source ``name``, empty if not generated yet."""
+    from images.models import Derivative
+
+    key = srcset_key(name)
+    result = cache.get(key)
+    if result is None:
+        result = {}
+        rows = Derivative.objects.filter(source_name=name).order_by('width').values_list('format', 'width', 'name')
+        for format, width, path in rows:
+            result.setdefault(format, []).append('%s %dw' % (default_storage.url(path), width))
+        result = {format: ', '.join(entries) for format, entries in result.items()}
+        cache.set(key, result, None)
+    return result
@@ -0,0 +1,91 @@
+"""Uploaded listing and doctor photos are shrunk before they reach storage.
+
+Anything larger than MAX_DIMENSION on its long side is scaled down with
+``Image.thumbnail``, which decodes JPEGs at a reduced scale (``draft``) and
+halves other formats with ``reduce`` before resampling, so the full-size
+bitmap is never resampled in memory. Images over MAX_PIXELS are not decoded
+at all. EXIF orientation is applied and EXIF/XMP dropped (the colour profile
+is kept); opaque images become progressive JPEGs, ones with real
+transparency WebP. An upload that needs no resizing or stripping is kept
+byte for byte unless re-encoding saves at least MIN_SAVING of it.
+"""
+import logging
+import os
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+MAX_DIMENSION = 2560
+MAX_PIXELS = 40 * 1000 * 1000
+JPEG_QUALITY = 85
+WEBP_QUALITY = 90
+MIN_SAVING = 0.1   # not worth another generation of JPEG loss below this
+EXTENSIONS = {'JPEG': '.jpg', 'WEBP': '.webp'}
+
+
+def has_alpha(image):
+    if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info:
+        alpha = image.convert('RGBA').getchannel('A')
+        return alpha.getextrema()[0] < 255
+    return False
+
+
+def encode(image):
+    """``(format, bytes)`` of ``image`` without metadata other than its colour profile."""
+    icc_profile = image.info.get('icc_profile')
+    buffer = BytesIO()
+    if has_alpha(image):
+        format = 'WEBP'
+        image.convert('RGBA').save(buffer, format, quality=WEBP_QUALITY, icc_profile=icc_profile)
+    else:
+        format = 'JPEG'
+        image.convert('RGB').save(buffer, format, quality=JPEG_QUALITY, optimize=True, progressive=True,
+                                  icc_profile=icc_profile)
+    return format, buffer.getvalue()
+
+
+def compress(source, name, size):
+    """``ContentFile`` to store instead of the open file ``source``, or None to keep it.
+
+    ``name`` is the file's current name; the new one only changes extension.
+    """
+    try:
+        image = Image.open(source)
+        if image.width * image.height > MAX_PIXELS:
+            logger.warning('%s is %dx%d, stored without recompressing', name, image.width, image.height)
+            return None
+        metadata = bool(image.getexif()) or 'xmp' in image.info or 'XML:com.adobe.xmp' in image.info
+        resized = max(image.size) > MAX_DIMENSION
+        image.thumbnail((MAX_DIMENSION, MAX_DIMENSION), Image.Resampling.LANCZOS, reducing_gap=2.0)
+        image = ImageOps.exif_transpose(image)
+        format, data = encode(image)
+    except (OSError, UnidentifiedImageError, Image.DecompressionBombError):
+        logger.warning('Cannot recompress %s, stored as uploaded', name, exc_info=True)
+        return None
+    finally:
+        source.seek(0)
+    if not resized and not metadata and len(data) > size * (1 - MIN_SAVING):
+        return None
+    return ContentFile(data, name=os.path.splitext(name)[0] + EXTENSIONS[format])
+
+
+def recompress(name, dry_run=False):
+    """Recompress the stored file ``name`` into a new file next to it.
+
+    Returns ``(new name, old bytes, new bytes)``, or None if it is kept; the
+    caller points the models at the new name and deletes the old file. Only
+    touches storage, so it can run in a worker process.
+    """
+    if not default_storage.exists(name):
+        return None
+    size = default_storage.size(name)
+    with default_storage.open(name, 'rb') as source:
+        content = compress(source, name, size)
+    if content is None:
+        return None
+    new_name = content.name if dry_run else default_storage.save(content.name, content)
+    return new_name, size, content.size
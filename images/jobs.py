@@ -0,0 +1,109 @@
+"""Durable queue of derivative builds.
+
+Saving a listing or doctor only upserts one ImageJob per photo (``enqueue``),
+so the admin returns at once. The image_worker command claims due jobs with
+SELECT ... FOR UPDATE SKIP LOCKED, so any number of workers never take the
+same row, and hands the Pillow work to a process pool. A failing job is
+retried with exponential backoff up to MAX_ATTEMPTS; a job whose worker died
+is claimed again once its lease has run out.
+
+Jobs are idempotent per content hash: a file whose derivatives were already
+built from the same bytes finishes without encoding anything, and identical
+files share their derivative files (see images.derivatives).
+"""
+import logging
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from images import derivatives
+from images.models import ImageJob
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+BACKOFF_SECONDS = 30      # doubled after every failed attempt
+MAX_BACKOFF_SECONDS = 3600
+LEASE_SECONDS = 600       # a running job not finished by then is claimed again
+
+
+def enqueue(names):
+    """Queue a (re)build of every stored file in ``names``, one query."""
+    now = timezone.now()
+    jobs = [ImageJob(source_name=name, status=ImageJob.PENDING, attempts=0, run_after=now)
+            for name in sorted(set(filter(None, names)))]
+    if jobs:
+        # a job already queued or running for the same file is reset, not duplicated;
+        # clearing locked_at keeps a running worker from marking the new request done
+        ImageJob.objects.bulk_create(
+            jobs, update_conflicts=True, unique_fields=['source_name'],
+            update_fields=['status', 'attempts', 'run_after', 'locked_at', 'last_error', 'updated'])
+    return len(jobs)
+
+
+def claim(limit):
+    """Lock up to ``limit`` due jobs for this worker and mark them running."""
+    now = timezone.now()
+    due = (Q(status=ImageJob.PENDING, run_after__lte=now)
+           | Q(status=ImageJob.RUNNING, locked_at__lt=now - timedelta(seconds=LEASE_SECONDS)))
+    with transaction.atomic():
+        jobs = list(ImageJob.objects.select_for_update(skip_locked=True).filter(due).order_by('run_after')[:limit])
+        for job in jobs:
+            job.status, job.locked_at, job.updated = ImageJob.RUNNING, now, now
+            job.attempts += 1
+        ImageJob.objects.bulk_update(jobs, ['status', 'locked_at', 'updated', 'attempts'])
+    return jobs
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def listing_ids_for(name):
+    from listings.models import Listing
+
+    query = Q(doctor__photo=name)
+    for field in derivatives.SOURCES['listings.Listing']:
+        query |= Q(**{field: name})
+    return Listing.objects.filter(query).values_list('pk', flat=True)
+
+
+def complete(job, result):
+    """Store what the worker rendered (``derivatives.render``) and close the job."""
+    from listings.cache import bump_listing_versions
+
+    fields = {'status': ImageJob.DONE, 'last_error': '', 'updated': timezone.now()}
+    if result is not None:
+        digest, rows = result
+        derivatives.record(job.source_name, digest, rows)
+        # cached detail fragments were rendered without the new srcset
+        bump_listing_versions(listing_ids_for(job.source_name))
+        fields['source_hash'] = digest
+    ImageJob.objects.filter(pk=job.pk, locked_at=job.locked_at).update(**fields)
+
+
+def fail(job, error):
+    now = timezone.now()
+    if job.attempts >= MAX_ATTEMPTS:
+        logger.error('Giving up on derivatives of %s after %d attempts: %s', job.source_name, job.attempts, error)
+        fields = {'status': ImageJob.FAILED}
+    else:
+        fields = {'status': ImageJob.PENDING, 'run_after': now + backoff(job.attempts)}
+    ImageJob.objects.filter(pk=job.pk, locked_at=job.locked_at).update(
+        last_error=repr(error), updated=now, **fields)
+
+
+def release(jobs):
+    # hand claimed jobs back without counting an attempt (worker shutting down)
+    for job in jobs:
+        ImageJob.objects.filter(pk=job.pk, locked_at=job.locked_at).update(
+            status=ImageJob.PENDING, attempts=job.attempts - 1, locked_at=None, updated=timezone.now())
+
+
+def counts():
+    result = dict.fromkeys((status for status, _ in ImageJob.STATUS_CHOICES), 0)
+    for status, total in ImageJob.objects.values_list('status').annotate(total=Count('pk')).order_by():
+        result[status] = total
+    return result
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from images import derivatives, jobs
+
+
+class Command(BaseCommand):
+    help = 'Queue the WebP/AVIF derivatives of every listing and doctor photo for the image_worker command'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--inline', action='store_true', help='build them in this process instead of queueing')
+
+    def handle(self, *args, **options):
+        names = derivatives.source_names()
+        if options['inline']:
+            built = sum(derivatives.generate(name) for name in names)
+            self.stdout.write('%d sources, %d (re)built, formats: %s' % (len(names), built, ', '.join(derivatives.FORMATS)))
+        else:
+            self.stdout.write('%d sources queued' % jobs.enqueue(names))
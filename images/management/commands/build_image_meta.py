@@ -0,0 +1,31 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from images import derivatives, metadata
+
+
+class Command(BaseCommand):
+    help = 'Record dimensions, size, hash and placeholder of every listing and doctor photo'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='reader processes (default: all cores)')
+        parser.add_argument('--force', action='store_true', help='measure files that already have metadata too')
+
+    def handle(self, *args, **options):
+        names = derivatives.source_names()
+        if not options['force']:
+            names = metadata.missing(names)
+        recorded = 0
+        if names:
+            # children only touch storage; never let them inherit a database socket
+            connections.close_all()
+            with ProcessPoolExecutor(max(1, options['processes'] or 1), initializer=django.setup) as pool:
+                for name, values in zip(names, pool.map(metadata.measure, names, chunksize=8)):
+                    if values is not None:
+                        metadata.record(name, values)
+                        recorded += 1
+        self.stdout.write('%d files measured, %d recorded' % (len(names), recorded))
@@ -0,0 +1,59 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from images import derivatives, metadata
+from images.models import Derivative, ImageMeta
+
+
+def hash_or_none(name):
+    return derivatives.content_hash(name) if default_storage.exists(name) else None
+
+
+class Command(BaseCommand):
+    help = 'Move listing and doctor photos into content-addressed storage, merging duplicates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='files hashed in parallel')
+        parser.add_argument('--dry-run', action='store_true', help='report the savings without changing anything')
+
+    def handle(self, *args, **options):
+        if not hasattr(default_storage, 'hashed_name'):
+            raise CommandError('The default storage is not images.storage.ContentAddressedStorage')
+        dry_run = options['dry_run']
+        names = [name for name in derivatives.source_names() if not default_storage.is_content_addressed(name)]
+        with ThreadPoolExecutor(max(1, options['threads'])) as pool:
+            digests = list(pool.map(hash_or_none, names))
+        moved = duplicates = reclaimed = 0
+        targets = set()
+        for name, digest in zip(names, digests):
+            if digest is None:
+                self.stderr.write('%s is missing, left as it is' % name)
+                continue
+            target = default_storage.hashed_name(digest, name)
+            if target in targets or default_storage.exists(target):
+                duplicates += 1
+                reclaimed += default_storage.size(name)
+            targets.add(target)
+            moved += 1
+            if not dry_run:
+                default_storage.link(name, target)
+                self.move_rows(name, target)
+                derivatives.rename_source(name, target)
+                default_storage.delete(name)
+        self.stdout.write('%d files %s, %d duplicates, %.1f MiB %s'
+                          % (moved, 'to move' if dry_run else 'moved', duplicates, reclaimed / 2 ** 20,
+                             'reclaimable' if dry_run else 'reclaimed'))
+
+    def move_rows(self, name, target):
+        # same bytes, so the metadata and derivatives carry over and the jobs queued
+        # by rename_source finish without encoding anything
+        for model in (ImageMeta, Derivative):
+            rows = model.objects.filter(source_name=name)
+            if model.objects.filter(source_name=target).exists():
+                rows.delete()
+            else:
+                rows.update(source_name=target)
+        cache.delete_many([metadata.meta_key(target), derivatives.srcset_key(target)])
@@ -0,0 +1,119 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.apps import apps
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from images import derivatives
+from images.models import Derivative, ImageMeta
+
+
+def referenced_sources():
+    names = set()
+    for label, fields in derivatives.SOURCES.items():
+        for row in apps.get_model(label).objects.values_list(*fields).iterator(chunk_size=2000):
+            names.update(row)
+    names.discard('')
+    return names
+
+
+def still_referenced(names, chunk_size=500):
+    """Those of ``names`` some row references now, e.g. uploaded again since the snapshot."""
+    names, found = sorted(names), set()
+    for start in range(0, len(names), chunk_size):
+        chunk = names[start:start + chunk_size]
+        for label, fields in derivatives.SOURCES.items():
+            query = Q()
+            for field in fields:
+                query |= Q(**{'%s__in' % field: chunk})
+            for row in apps.get_model(label).objects.filter(query).values_list(*fields):
+                found.update(row)
+    return found.intersection(names)
+
+
+def scan_directory(root, directory, referenced, cutoff, delete):
+    """``(subdirectories, files, orphans)`` of one directory; orphans are ``(name, bytes)``.
+
+    One task per directory keeps memory to the referenced names and the
+    directories still to visit, however many files the tree holds.
+    """
+    subdirectories, files, orphans = [], 0, []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir(follow_symlinks=False):
+                subdirectories.append(entry.path)
+                continue
+            if not entry.is_file(follow_symlinks=False):
+                continue
+            files += 1
+            name = os.path.relpath(entry.path, root).replace(os.sep, '/')
+            if name in referenced:
+                continue
+            stat = entry.stat(follow_symlinks=False)
+            if stat.st_mtime > cutoff:
+                continue  # an upload is stored before the row naming it is committed
+            if delete:
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    continue
+            orphans.append((name, stat.st_size))
+    return subdirectories, files, orphans
+
+
+class Command(BaseCommand):
+    help = 'Report or delete media files no Listing or Doctor references anymore'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='only list the orphans')
+        parser.add_argument('--threads', type=int, default=16, help='directories scanned in parallel')
+        parser.add_argument('--min-age', type=int, default=3600, help='seconds a file must be old to be collected')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        cutoff = time.time() - options['min_age']
+        referenced = referenced_sources()
+        stale = set()
+        for source_name, name in Derivative.objects.values_list('source_name', 'name').iterator(chunk_size=2000):
+            if source_name in referenced:
+                referenced.add(name)
+            else:
+                stale.add(source_name)
+        stale.update(name for name in ImageMeta.objects.values_list('source_name', flat=True).iterator(chunk_size=2000)
+                     if name not in referenced)
+        if stale:
+            # rows younger than --min-age and sources referenced again since the snapshot
+            # stay, and so do their files; the other rows would point at nothing
+            again = still_referenced(stale)
+            referenced |= again
+            old = Q(source_name__in=stale - again, created__lt=timezone.now() - timedelta(seconds=options['min_age']))
+            referenced.update(Derivative.objects.filter(source_name__in=stale).exclude(old).values_list('name', flat=True))
+            for model in (Derivative, ImageMeta):
+                referenced.update(model.objects.filter(source_name__in=stale).exclude(old).values_list('source_name', flat=True))
+                if not dry_run:
+                    model.objects.filter(old).delete()
+            stale -= referenced
+        self.stdout.write('%d referenced files, %d unreferenced sources with derivatives or metadata' % (len(referenced), len(stale)))
+
+        root = os.path.abspath(settings.MEDIA_ROOT)
+        files = orphans = orphan_bytes = 0
+        with ThreadPoolExecutor(max(1, options['threads'])) as pool:
+            pending = {pool.submit(scan_directory, root, root, referenced, cutoff, not dry_run)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    subdirectories, count, found = future.result()
+                    files += count
+                    for name, size in found:
+                        orphans, orphan_bytes = orphans + 1, orphan_bytes + size
+                        if dry_run or options['verbosity'] > 1:
+                            self.stdout.write('%s  %d KiB' % (name, size // 1024))
+                    pending.update(pool.submit(scan_directory, root, directory, referenced, cutoff, not dry_run)
+                                   for directory in subdirectories)
+        self.stdout.write('%d files scanned, %d orphans, %.1f MiB %s'
+                          % (files, orphans, orphan_bytes / 2 ** 20, 'reclaimable' if dry_run else 'deleted'))
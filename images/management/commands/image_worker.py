@@ -0,0 +1,70 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from images import derivatives, jobs
+
+
+class Command(BaseCommand):
+    help = 'Build queued image derivatives in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='encoder processes (default: all cores)')
+        parser.add_argument('--poll', type=float, default=2.0, help='seconds between queue checks when idle')
+        parser.add_argument('--once', action='store_true', help='exit when the queue is empty')
+
+    def handle(self, *args, **options):
+        processes, poll = max(1, options['processes'] or 1), options['poll']
+        built = failed = 0
+        running = {}   # future -> claimed job
+        pool = self.pool(processes)
+        try:
+            while True:
+                # keep every process busy with one job queued behind it
+                if len(running) < processes * 2:
+                    for job in jobs.claim(processes * 2 - len(running)):
+                        future = pool.submit(derivatives.render, job.source_name, derivatives.known_hash(job.source_name))
+                        running[future] = job
+                if not running:
+                    if options['once']:
+                        break
+                    time.sleep(poll)
+                    continue
+                done, _ = wait(running, timeout=poll, return_when=FIRST_COMPLETED)
+                broken = False
+                for future in done:
+                    job = running.pop(future)
+                    try:
+                        result = future.result()
+                    except BrokenProcessPool as error:
+                        # a decoder crashed the process; the pool cannot be reused
+                        jobs.fail(job, error)
+                        failed, broken = failed + 1, True
+                    except Exception as error:
+                        jobs.fail(job, error)
+                        failed += 1
+                    else:
+                        jobs.complete(job, result)
+                        built += result is not None
+                if broken:
+                    for job in running.values():
+                        jobs.fail(job, BrokenProcessPool('worker pool restarted'))
+                    failed += len(running)
+                    running.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = self.pool(processes)
+        finally:
+            jobs.release(running.values())
+            pool.shutdown(wait=False, cancel_futures=True)
+        self.stdout.write('%d built, %d failed, queue: %s'
+                          % (built, failed, ', '.join('%s %d' % item for item in jobs.counts().items())))
+
+    def pool(self, processes):
+        # children only touch storage; never let them inherit a database socket
+        connections.close_all()
+        return ProcessPoolExecutor(processes, initializer=django.setup)
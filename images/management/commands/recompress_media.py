@@ -0,0 +1,44 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import django
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from images import derivatives, ingest
+from images.models import Derivative, ImageMeta
+
+
+class Command(BaseCommand):
+    help = 'Downscale, strip and re-encode the stored listing and doctor photos'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=os.cpu_count(), help='encoder processes (default: all cores)')
+        parser.add_argument('--dry-run', action='store_true', help='report the savings without changing anything')
+
+    def handle(self, *args, **options):
+        names, dry_run = derivatives.source_names(), options['dry_run']
+        before = after = changed = 0
+        # children only touch storage; never let them inherit a database socket
+        connections.close_all()
+        with ProcessPoolExecutor(max(1, options['processes'] or 1), initializer=django.setup) as pool:
+            results = pool.map(partial(ingest.recompress, dry_run=dry_run), names, chunksize=4)
+            for name, result in zip(names, results):
+                if result is None:
+                    continue
+                new_name, old_bytes, new_bytes = result
+                before, after, changed = before + old_bytes, after + new_bytes, changed + 1
+                self.stdout.write('%s -> %s  %d KiB -> %d KiB' % (name, new_name, old_bytes // 1024, new_bytes // 1024))
+                if not dry_run:
+                    self.replace(name, new_name)
+        self.stdout.write('%d of %d files %s, %.1f MiB -> %.1f MiB'
+                          % (changed, len(names), 'would change' if dry_run else 'recompressed',
+                             before / 2 ** 20, after / 2 ** 20))
+
+    def replace(self, name, new_name):
+        derivatives.rename_source(name, new_name)
+        Derivative.objects.filter(source_name=name).delete()
+        ImageMeta.objects.filter(source_name=name).delete()
+        default_storage.delete(name)
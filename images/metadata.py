@@ -0,0 +1,93 @@
+"""Dimensions, size, content hash and a placeholder of every uploaded photo.
+
+Recorded when a Listing or Doctor is saved with a file that has no ImageMeta
+yet, so templates can give every ``<img>`` its width and height (no layout
+shift while it loads) and a blurred 16px preview inlined as a data URI,
+without opening the file. ``measure`` only reads storage, which lets the
+build_image_meta command run it in a process pool.
+"""
+import base64
+import hashlib
+import io
+import logging
+
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError
+
+from images.derivatives import content_hash
+
+logger = logging.getLogger(__name__)
+
+PLACEHOLDER_SIZE = 16
+PLACEHOLDER_QUALITY = 40
+META_KEY = 'images:meta:%s'
+TRANSPOSED = {5, 6, 7, 8}   # EXIF orientations that swap width and height
+
+
+def placeholder(image):
+    image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    image.thumbnail((PLACEHOLDER_SIZE, PLACEHOLDER_SIZE))
+    buffer = io.BytesIO()
+    image.save(buffer, 'WEBP', quality=PLACEHOLDER_QUALITY)
+    return 'data:image/webp;base64,' + base64.b64encode(buffer.getvalue()).decode()
+
+
+def measure(name):
+    """ImageMeta field values for the stored file ``name``, None if it is missing or unreadable."""
+    if not name or not default_storage.exists(name):
+        return None
+    try:
+        with default_storage.open(name, 'rb') as source:
+            image = Image.open(source)
+            width, height = image.size
+            if image.getexif().get(ExifTags.Base.Orientation) in TRANSPOSED:
+                width, height = height, width
+            image.draft('RGB', (PLACEHOLDER_SIZE * 4, PLACEHOLDER_SIZE * 4))
+            preview = placeholder(ImageOps.exif_transpose(image))
+    except (OSError, UnidentifiedImageError):
+        logger.warning('Cannot read %s for metadata', name, exc_info=True)
+        return None
+    return {'sha256': content_hash(name), 'width': width, 'height': height,
+            'bytes': default_storage.size(name), 'placeholder': preview}
+
+
+def meta_key(name):
+    return META_KEY % hashlib.md5(name.encode()).hexdigest()
+
+
+def record(name, values):
+    from images.models import ImageMeta
+
+    ImageMeta.objects.update_or_create(source_name=name, defaults=values)
+    cache.delete(meta_key(name))
+
+
+def missing(names):
+    from images.models import ImageMeta
+
+    names = set(filter(None, names))
+    return sorted(names - set(ImageMeta.objects.filter(source_name__in=names).values_list('source_name', flat=True)))
+
+
+def ensure(names):
+    """Measure and record the files of ``names`` that have no metadata yet."""
+    recorded = 0
+    for name in missing(names):
+        values = measure(name)
+        if values is not None:
+            record(name, values)
+            recorded += 1
+    return recorded
+
+
+def meta(name):
+    """``{'width', 'height', 'placeholder'}`` of the source ``name``, empty if not recorded."""
+    from images.models import ImageMeta
+
+    key = meta_key(name)
+    result = cache.get(key)
+    if result is None:
+        result = ImageMeta.objects.filter(source_name=name).values('width', 'height', 'placeholder').first() or {}
+        cache.set(key, result, None)
+    return result
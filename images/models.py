@@ -0,0 +1,64 @@
+from django.core.files.storage import default_storage
+from django.db import models
+
+# Create your models here.
+class Derivative(models.Model):
+    # a resized, re-encoded copy of an uploaded photo (see images.derivatives)
+    source_name = models.CharField(max_length=255, db_index=True)
+    source_hash = models.CharField(max_length=64)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    format = models.CharField(max_length=8)
+    name = models.CharField(max_length=255)
+    bytes = models.PositiveIntegerField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['source_name', 'width', 'format'], name='derivative_source_width_format'),
+        ]
+
+    @property
+    def url(self):
+        return default_storage.url(self.name)
+
+    def __str__(self):
+        return self.name
+
+
+class ImageJob(models.Model):
+    # one pending derivative build per source file (see images.jobs)
+    PENDING, RUNNING, DONE, FAILED = 'pending', 'running', 'done', 'failed'
+    STATUS_CHOICES = ((PENDING, 'Pending'), (RUNNING, 'Running'), (DONE, 'Done'), (FAILED, 'Failed'))
+
+    source_name = models.CharField(max_length=255, unique=True)
+    source_hash = models.CharField(max_length=64, blank=True)
+    status = models.CharField(max_length=8, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField()
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='imagejob_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return '%s (%s)' % (self.source_name, self.status)
+
+
+class ImageMeta(models.Model):
+    # what templates need to know about an uploaded photo without opening it (see images.metadata)
+    source_name = models.CharField(max_length=255, unique=True)
+    sha256 = models.CharField(max_length=64, db_index=True)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    bytes = models.PositiveBigIntegerField()
+    placeholder = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return '%s (%dx%d)' % (self.source_name, self.width, self.height)
@@ -0,0 +1,58 @@
+from django.db import transaction
+from django.db.models.signals import post_save, pre_save
+from django.dispatch import receiver
+
+from doctors.models import Doctor
+from images import derivatives, ingest, jobs, metadata
+from listings.models import Listing
+
+
+@receiver(pre_save, sender=Listing)
+@receiver(pre_save, sender=Doctor)
+def compress_uploads(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    instance._changed_photos = changed_photos(sender, instance)
+    for field in instance._changed_photos:
+        file = getattr(instance, field)
+        # only a new upload is uncommitted; FileField.pre_save stores whatever is assigned here
+        if file and not file._committed:
+            compressed = ingest.compress(file.file, file.name, file.size)
+            if compressed is not None:
+                setattr(instance, field, compressed)
+
+
+def changed_photos(sender, instance):
+    """Photo fields holding a new upload or another stored file than the saved row."""
+    fields = derivatives.SOURCES[instance._meta.label]
+    stored = None
+    if not instance._state.adding:
+        stored = sender._default_manager.filter(pk=instance.pk).values_list(*fields).first()
+    return [field for index, field in enumerate(fields)
+            if not getattr(instance, field)._committed or stored is None or stored[index] != getattr(instance, field).name]
+
+
+def uploaded(instance):
+    # other fields keep their metadata and jobs, whatever state those are in (a FAILED job stays failed)
+    names = [getattr(instance, field).name for field in getattr(instance, '_changed_photos', ())]
+    if not any(names):
+        return
+
+    def process():
+        # dimensions and placeholder now (cheap, new files only), the derivatives
+        # by the image_worker command, which also bumps the affected listings
+        metadata.ensure(names)
+        jobs.enqueue(names)
+    transaction.on_commit(process)
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        uploaded(instance)
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        uploaded(instance)
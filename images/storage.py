@@ -0,0 +1,69 @@
+"""Content-addressed file storage for uploaded photos.
+
+A file saved under one of ``hashed_prefixes`` (the ``upload_to`` directories
+of the photo fields) is stored as ``content/ab/<sha256>.<ext>`` instead, and
+that is the name the field keeps. Uploading the same photo again, under any
+date or by another listing or doctor, writes nothing and returns the existing
+name, so each image is on disk, in backups and in CDN caches once. Everything
+else (derivatives, admin uploads elsewhere) is stored as FileSystemStorage
+would.
+
+New content is written to a temporary name and hard-linked into place, so a
+hashed name is never visible half written and two concurrent uploads of the
+same bytes simply end up with one file. Hashed names never change content,
+which is what lets them be cached as immutable.
+"""
+import hashlib
+import os
+
+from django.core.files.storage import FileSystemStorage
+from django.utils.crypto import get_random_string
+
+CHUNK_SIZE = 64 * 1024
+EXTENSIONS = {'.jpeg': '.jpg'}
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def __init__(self, *args, hashed_prefixes=('photos/', 'doctors/'), directory='content', **kwargs):
+        super().__init__(*args, **kwargs)
+        self.hashed_prefixes = tuple(hashed_prefixes)
+        self.directory = directory
+
+    def hashed(self, name):
+        # anything written into the content directory is re-hashed too, e.g. a recompressed copy
+        return name.replace('\\', '/').startswith(self.hashed_prefixes + (self.directory + '/',))
+
+    def is_content_addressed(self, name):
+        return name.replace('\\', '/').startswith(self.directory + '/')
+
+    def hashed_name(self, digest, name):
+        extension = os.path.splitext(name)[1].lower()
+        extension = EXTENSIONS.get(extension, extension)
+        return '%s/%s/%s%s' % (self.directory, digest[:2], digest, extension)
+
+    def _save(self, name, content):
+        if not self.hashed(name):
+            return super()._save(name, content)
+        digest = hashlib.sha256()
+        content.seek(0)
+        for chunk in content.chunks(CHUNK_SIZE):
+            digest.update(chunk)
+        content.seek(0)
+        target = self.hashed_name(digest.hexdigest(), name)
+        if self.exists(target):
+            return target
+        temporary = super()._save('%s/incoming/%s' % (self.directory, get_random_string(16)), content)
+        try:
+            self.link(temporary, target)
+        finally:
+            self.delete(temporary)
+        return target
+
+    def link(self, name, target):
+        """Give the stored file ``name`` the additional name ``target`` (kept if it already exists)."""
+        path = self.path(target)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            os.link(self.path(name), path)
+        except FileExistsError:
+            pass  # same name, same bytes
@@ -0,0 +1,46 @@
+from urllib.parse import unquote
+
+from django import template
+from django.conf import settings
+from django.utils.html import format_html, format_html_join
+
+from images.derivatives import CONTENT_TYPES, FORMATS, srcsets
+from images.metadata import meta
+
+register = template.Library()
+
+
+def source_name(image):
+    # an ImageField value, or a MEDIA_URL url as stored on ListingCard
+    if hasattr(image, 'name'):
+        return image.name, image.url if image.name else ''
+    url = str(image or '')
+    if url.startswith(settings.MEDIA_URL):
+        return unquote(url[len(settings.MEDIA_URL):]), url
+    return '', url
+
+
+@register.simple_tag
+def responsive_image(image, sizes='100vw', lazy=True, **attrs):
+    """``<picture>`` with AVIF/WebP ``srcset`` sources in front of the original image.
+
+    Other keyword arguments (``class``, ``alt``, ``style``...) go on the ``<img>``,
+    along with the recorded width/height and placeholder background (see images.metadata).
+    """
+    name, url = source_name(image)
+    sets = srcsets(name) if name else {}
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((CONTENT_TYPES[format], sets[format], sizes) for format in FORMATS if format in sets))
+    attrs.setdefault('alt', '')
+    info = meta(name) if name else {}
+    if info:
+        attrs.setdefault('width', info['width'])
+        attrs.setdefault('height', info['height'])
+        if info['placeholder']:
+            style = 'background: url(%s) center / cover no-repeat' % info['placeholder']
+            attrs['style'] = '%s; %s' % (style, attrs['style']) if attrs.get('style') else style
+    if lazy:
+        attrs['loading'] = 'lazy'
+    return format_html('<picture>{}<img src="{}"{}></picture>',
+                       sources, url, format_html_join('', ' {}="{}"', attrs.items()))
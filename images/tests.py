@@ -0,0 +1,484 @@
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from django.utils.http import http_date
+from PIL import ExifTags, Image
+
+from config import testing
+from doctors.models import Doctor
+from images import derivatives, ingest, jobs, metadata
+from images.management.commands.image_worker import Command as WorkerCommand
+from images.models import Derivative, ImageJob, ImageMeta
+from images.templatetags.images import responsive_image
+from images.views import IMMUTABLE_MAX_AGE, MAX_AGE
+
+
+def exif(orientation):
+    tags = Image.Exif()
+    tags[ExifTags.Base.Orientation] = orientation
+    tags[ExifTags.Base.Model] = 'Camera'
+    return tags
+
+
+def image_bytes(size=(64, 48), format='PNG', color=(200, 30, 30), **params):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, color).save(buffer, format, **params)
+    return buffer.getvalue()
+
+
+class MediaTestCase(TestCase):
+    """Test case with an empty MEDIA_ROOT and the test caches."""
+
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        self.enterContext(override_settings(MEDIA_ROOT=media_root, CACHES=testing.CACHES))
+        cache.clear()
+
+    def create_doctor(self, photo, **fields):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Doctor.objects.create(photo=photo, **{'name': 'Dr Ho', 'email': 'ho@example.com', **fields})
+
+
+class DerivativeTests(MediaTestCase):
+    def test_widths_never_upscale(self):
+        self.assertEqual(derivatives.target_widths(200), [200])
+        self.assertEqual(derivatives.target_widths(800), [320, 640, 800])
+        self.assertEqual(derivatives.target_widths(4000), list(derivatives.WIDTHS))
+
+    def test_generate_encodes_every_width_and_format(self):
+        name = default_storage.save('photos/a.png', ContentFile(image_bytes((800, 600))))
+        self.assertTrue(derivatives.generate(name))
+        rows = Derivative.objects.filter(source_name=name)
+        self.assertEqual(rows.count(), 3 * len(derivatives.FORMATS))
+        self.assertEqual(set(rows.values_list('width', 'height')), {(320, 240), (640, 480), (800, 600)})
+        for path, format, width in rows.values_list('name', 'format', 'width'):
+            with default_storage.open(path) as stored, Image.open(stored) as image:
+                self.assertEqual((image.format.lower(), image.width), (format, width))
+        self.assertFalse(derivatives.generate(name))  # same bytes, nothing to rebuild
+        self.assertFalse(derivatives.generate('photos/missing.png'))
+
+    def test_unreadable_source_is_skipped(self):
+        name = default_storage.save('photos/broken.png', ContentFile(b'not an image'))
+        with self.assertLogs('images.derivatives', 'WARNING'):
+            self.assertFalse(derivatives.generate(name))
+        self.assertFalse(Derivative.objects.exists())
+
+    def test_srcsets_are_cached_until_regenerated(self):
+        name = default_storage.save('uploads/a.png', ContentFile(image_bytes((800, 600))))
+        self.assertEqual(derivatives.srcsets(name), {})
+        derivatives.generate(name)
+        sets = derivatives.srcsets(name)
+        self.assertEqual(set(sets), set(derivatives.FORMATS))
+        self.assertEqual([entry.rsplit(' ', 1)[1] for entry in sets['webp'].split(', ')], ['320w', '640w', '800w'])
+        with self.assertNumQueries(0):
+            derivatives.srcsets(name)
+
+        with default_storage.open(name, 'wb') as stored:
+            stored.write(image_bytes((400, 300), color=(0, 90, 200)))
+        derivatives.generate(name)
+        self.assertIn('400w', derivatives.srcsets(name)['webp'])
+
+    def test_picture_tag_lists_the_derivatives(self):
+        name = default_storage.save('photos/a.png', ContentFile(image_bytes((800, 600))))
+        derivatives.generate(name)
+        html = responsive_image(default_storage.url(name), sizes='50vw', alt='Clinic')
+        self.assertIn('<source type="image/webp" srcset="%s" sizes="50vw">' % derivatives.srcsets(name)['webp'], html)
+        self.assertIn('<img src="%s" alt="Clinic" loading="lazy">' % default_storage.url(name), html)
+        self.assertEqual(responsive_image(''), '<picture><img src="" alt="" loading="lazy"></picture>')
+
+
+class MetadataTests(MediaTestCase):
+    def test_measure(self):
+        name = default_storage.save('uploads/a.png', ContentFile(image_bytes((64, 48))))
+        values = metadata.measure(name)
+        self.assertEqual((values['width'], values['height'], values['bytes']), (64, 48, default_storage.size(name)))
+        self.assertEqual(values['sha256'], derivatives.content_hash(name))
+        self.assertTrue(values['placeholder'].startswith('data:image/webp;base64,'))
+        self.assertIsNone(metadata.measure('uploads/missing.png'))
+
+    def test_transposed_orientation_swaps_the_dimensions(self):
+        for orientation, size in ((1, (64, 48)), (3, (64, 48)), (6, (48, 64)), (8, (48, 64))):
+            with self.subTest(orientation=orientation):
+                name = default_storage.save('uploads/a.jpg', ContentFile(image_bytes((64, 48), 'JPEG', exif=exif(orientation))))
+                values = metadata.measure(name)
+                self.assertEqual((values['width'], values['height']), size)
+
+    def test_saved_photos_are_recorded_once(self):
+        doctor = self.create_doctor(SimpleUploadedFile('ho.png', image_bytes((64, 48))))
+        self.assertEqual(ImageMeta.objects.get().source_name, doctor.photo.name)
+        self.assertEqual(metadata.ensure([doctor.photo.name, '']), 0)
+        info = metadata.meta(doctor.photo.name)
+        self.assertEqual((info['width'], info['height']), (64, 48))
+        with self.assertNumQueries(0):
+            metadata.meta(doctor.photo.name)
+        self.assertEqual(metadata.meta('uploads/missing.png'), {})
+
+    def test_picture_tag_reserves_the_space(self):
+        doctor = self.create_doctor(SimpleUploadedFile('ho.png', image_bytes((64, 48))))
+        html = responsive_image(doctor.photo, style='border: 0')
+        self.assertIn(' width="64" height="48"', html)
+        self.assertIn(' style="background: url(data:image/webp;base64,', html)
+        self.assertIn('center / cover no-repeat; border: 0"', html)
+
+
+class IngestTests(MediaTestCase):
+    def compress(self, data, name='photos/upload.png'):
+        source = io.BytesIO(data)
+        source.seek(10)
+        content = ingest.compress(source, name, len(data))
+        self.assertEqual(source.tell(), 0)  # rewound for whoever stores it next
+        return content
+
+    def open(self, content):
+        image = Image.open(io.BytesIO(content.read()))
+        content.seek(0)
+        return image
+
+    def test_pixel_cap_skips_decoding(self):
+        with mock.patch.object(ingest, 'MAX_PIXELS', 100), self.assertLogs('images.ingest', 'WARNING'), \
+                mock.patch.object(ingest, 'encode') as encode:
+            self.assertIsNone(self.compress(image_bytes((64, 48))))
+        encode.assert_not_called()
+
+    def test_large_images_are_scaled_down(self):
+        with mock.patch.object(ingest, 'MAX_DIMENSION', 100):
+            content = self.compress(image_bytes((400, 300)))
+        self.assertEqual(content.name, 'photos/upload.jpg')
+        image = self.open(content)
+        self.assertEqual((image.format, image.size), ('JPEG', (100, 75)))
+
+    def test_exif_is_applied_and_stripped(self):
+        content = self.compress(image_bytes((64, 48), 'JPEG', exif=exif(6)), 'photos/upload.jpeg')
+        image = self.open(content)
+        self.assertEqual(image.size, (48, 64))
+        self.assertFalse(image.getexif())
+        self.assertEqual(content.name, 'photos/upload.jpg')
+
+    def test_transparency_is_kept_as_webp(self):
+        buffer = io.BytesIO()
+        Image.new('RGBA', (64, 48), (200, 30, 30, 100)).save(buffer, 'PNG')
+        content = self.compress(buffer.getvalue())
+        self.assertEqual(content.name, 'photos/upload.webp')
+        image = self.open(content)
+        self.assertEqual((image.format, image.mode), ('WEBP', 'RGBA'))
+
+    def test_small_saving_keeps_the_upload(self):
+        already = image_bytes((64, 48), 'JPEG', quality=ingest.JPEG_QUALITY, optimize=True, progressive=True)
+        self.assertIsNone(self.compress(already, 'photos/upload.jpg'))
+        noise = Image.frombytes('RGB', (128, 128), os.urandom(128 * 128 * 3))
+        buffer = io.BytesIO()
+        noise.save(buffer, 'PNG')
+        self.assertEqual(self.open(self.compress(buffer.getvalue())).format, 'JPEG')
+
+    def test_unreadable_upload_is_stored_as_it_is(self):
+        with self.assertLogs('images.ingest', 'WARNING'):
+            self.assertIsNone(self.compress(b'not an image'))
+
+    def test_uploads_are_compressed_before_storage(self):
+        doctor = self.create_doctor(SimpleUploadedFile('ho.jpeg', image_bytes((64, 48), 'JPEG', exif=exif(6))))
+        self.assertTrue(doctor.photo.name.endswith('.jpg'))
+        with default_storage.open(doctor.photo.name) as stored, Image.open(stored) as image:
+            self.assertEqual(image.size, (48, 64))
+            self.assertFalse(image.getexif())
+
+
+class ContentAddressedStorageTests(MediaTestCase):
+    def stored_files(self):
+        return sorted(os.path.relpath(os.path.join(directory, file), default_storage.location).replace(os.sep, '/')
+                      for directory, _, files in os.walk(default_storage.location) for file in files)
+
+    def test_same_bytes_are_stored_once(self):
+        data = image_bytes()
+        first = default_storage.save('photos/2024/01/a.png', ContentFile(data))
+        second = default_storage.save('doctors/b.PNG', ContentFile(data))
+        digest = hashlib.sha256(data).hexdigest()
+        self.assertEqual(first, 'content/%s/%s.png' % (digest[:2], digest))
+        self.assertEqual(second, first)
+        self.assertEqual(self.stored_files(), [first])
+        self.assertTrue(default_storage.is_content_addressed(first))
+
+    def test_other_directories_are_stored_as_named(self):
+        self.assertEqual(default_storage.save('uploads/a.png', ContentFile(b'1')), 'uploads/a.png')
+        self.assertEqual(default_storage.save('photos/a.jpeg', ContentFile(b'1'))[-4:], '.jpg')
+
+    def test_uploads_of_the_same_photo_share_a_file(self):
+        first = self.create_doctor(SimpleUploadedFile('ho.png', image_bytes()))
+        second = self.create_doctor(SimpleUploadedFile('chan.png', image_bytes()), email='chan@example.com')
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertEqual(self.stored_files(), [first.photo.name])
+
+    def test_dedupe_moves_legacy_files(self):
+        data = image_bytes()
+        for name in ('legacy/a.png', 'legacy/b.png'):
+            default_storage.save(name, ContentFile(data))
+        first = self.create_doctor('legacy/a.png')
+        second = self.create_doctor('legacy/b.png', email='chan@example.com')
+        self.assertEqual(ImageMeta.objects.count(), 2)
+
+        call_command('dedupe_media', dry_run=True, stdout=io.StringIO())
+        self.assertEqual(self.stored_files(), ['legacy/a.png', 'legacy/b.png'])
+
+        out = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_media', stdout=out)
+        self.assertIn('2 files moved, 1 duplicates', out.getvalue())
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual(first.photo.name, second.photo.name)
+        self.assertTrue(default_storage.is_content_addressed(first.photo.name))
+        self.assertEqual(self.stored_files(), [first.photo.name])
+        self.assertEqual(list(ImageMeta.objects.values_list('source_name', flat=True)), [first.photo.name])
+
+
+class GarbageCollectionTests(MediaTestCase):
+    def age(self, name, seconds=7200):
+        then = time.time() - seconds
+        os.utime(default_storage.path(name), (then, then))
+        for model in (Derivative, ImageMeta):
+            model.objects.filter(source_name=name).update(created=timezone.now() - timedelta(seconds=seconds))
+
+    def test_only_old_orphans_are_collected(self):
+        doctor = self.create_doctor(SimpleUploadedFile('ho.png', image_bytes((800, 600))))
+        derivatives.generate(doctor.photo.name)
+        kept = [doctor.photo.name, *Derivative.objects.values_list('name', flat=True)]
+        young = default_storage.save('uploads/young.png', ContentFile(b'1'))
+        old = default_storage.save('photos/old.png', ContentFile(image_bytes(color=(0, 90, 200))))
+        derivatives.generate(old)
+        metadata.ensure([old])
+        orphans = [old, *Derivative.objects.filter(source_name=old).values_list('name', flat=True)]
+        for name in kept + orphans:
+            self.age(name)
+
+        out = io.StringIO()
+        call_command('gc_media', dry_run=True, min_age=3600, stdout=out)
+        self.assertTrue(all(name in out.getvalue() for name in orphans))
+        self.assertTrue(all(default_storage.exists(name) for name in orphans))
+        self.assertTrue(Derivative.objects.filter(source_name=old).exists())
+
+        call_command('gc_media', min_age=3600, stdout=io.StringIO())
+        self.assertFalse(any(default_storage.exists(name) for name in orphans))
+        self.assertTrue(all(default_storage.exists(name) for name in kept + [young]))
+        self.assertFalse(Derivative.objects.filter(source_name=old).exists())
+        self.assertFalse(ImageMeta.objects.filter(source_name=old).exists())
+        self.assertTrue(ImageMeta.objects.filter(source_name=doctor.photo.name).exists())
+
+        call_command('gc_media', min_age=0, stdout=io.StringIO())
+        self.assertFalse(default_storage.exists(young))
+
+    def test_rows_of_a_photo_saved_during_the_scan_are_kept(self):
+        # stored and measured, but the row naming it commits after the snapshot
+        name = default_storage.save('photos/new.png', ContentFile(image_bytes((800, 600))))
+        derivatives.generate(name)
+        metadata.ensure([name])
+        files = [name, *Derivative.objects.values_list('name', flat=True)]
+        for path in files:
+            os.utime(default_storage.path(path), (time.time() - 7200,) * 2)  # same bytes stored long ago
+        call_command('gc_media', min_age=3600, stdout=io.StringIO())
+        self.assertEqual(Derivative.objects.count(), len(files) - 1)
+        self.assertTrue(ImageMeta.objects.filter(source_name=name).exists())
+        self.assertTrue(all(default_storage.exists(path) for path in files))
+
+    def test_photo_referenced_again_after_the_snapshot_is_kept(self):
+        doctor = self.create_doctor(SimpleUploadedFile('ho.png', image_bytes((800, 600))))
+        derivatives.generate(doctor.photo.name)
+        files = [doctor.photo.name, *Derivative.objects.values_list('name', flat=True)]
+        for path in files:
+            self.age(path)
+        with mock.patch('images.management.commands.gc_media.referenced_sources', return_value=set()):
+            call_command('gc_media', min_age=3600, stdout=io.StringIO())
+        self.assertEqual(Derivative.objects.count(), len(files) - 1)
+        self.assertTrue(ImageMeta.objects.filter(source_name=doctor.photo.name).exists())
+        self.assertTrue(all(default_storage.exists(path) for path in files))
+
+
+class ImageJobTests(MediaTestCase):
+    def claim_one(self):
+        claimed = jobs.claim(10)
+        self.assertEqual(len(claimed), 1)
+        return claimed[0]
+
+    def test_save_queues_only_changed_photos(self):
+        doctor = self.create_doctor(SimpleUploadedFile('ho.png', image_bytes()))
+        first = doctor.photo.name
+        self.assertEqual(list(ImageJob.objects.values_list('source_name', 'status')), [(first, ImageJob.PENDING)])
+        ImageJob.objects.update(status=ImageJob.FAILED, attempts=jobs.MAX_ATTEMPTS)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.name = 'Dr Ho Ka Ming'
+            doctor.save()
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.FAILED)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            doctor.photo = SimpleUploadedFile('ho.png', image_bytes(color=(0, 90, 200)))
+            doctor.save()
+        self.assertEqual(dict(ImageJob.objects.values_list('source_name', 'status')),
+                         {first: ImageJob.FAILED, doctor.photo.name: ImageJob.PENDING})
+
+    def test_claim_takes_due_jobs_once(self):
+        jobs.enqueue(['photos/a.jpg', 'photos/b.jpg'])
+        ImageJob.objects.filter(source_name='photos/b.jpg').update(run_after=timezone.now() + timedelta(minutes=5))
+        job = self.claim_one()
+        self.assertEqual((job.source_name, job.status, job.attempts), ('photos/a.jpg', ImageJob.RUNNING, 1))
+        self.assertEqual(jobs.claim(10), [])
+
+    def test_expired_lease_is_claimed_again(self):
+        jobs.enqueue(['photos/a.jpg'])
+        job = self.claim_one()
+        ImageJob.objects.filter(pk=job.pk).update(
+            locked_at=timezone.now() - timedelta(seconds=jobs.LEASE_SECONDS + 1))
+        again = self.claim_one()
+        self.assertEqual((again.pk, again.attempts), (job.pk, 2))
+        jobs.complete(job, None)  # the first worker's lease is gone
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.RUNNING)
+        jobs.complete(again, None)
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.DONE)
+
+    def test_failed_job_backs_off_then_gives_up(self):
+        jobs.enqueue(['photos/a.jpg'])
+        job = self.claim_one()
+        jobs.fail(job, OSError('disk'))
+        row = ImageJob.objects.get()
+        self.assertEqual(row.status, ImageJob.PENDING)
+        self.assertGreater(row.run_after, timezone.now() + timedelta(seconds=jobs.BACKOFF_SECONDS - 5))
+        self.assertIn('disk', row.last_error)
+        self.assertEqual(jobs.claim(10), [])
+
+        ImageJob.objects.update(run_after=timezone.now(), attempts=jobs.MAX_ATTEMPTS - 1)
+        with self.assertLogs('images.jobs', 'ERROR'):
+            jobs.fail(self.claim_one(), OSError('disk'))
+        self.assertEqual(ImageJob.objects.get().status, ImageJob.FAILED)
+        self.assertEqual(jobs.backoff(20), timedelta(seconds=jobs.MAX_BACKOFF_SECONDS))
+
+    def test_release_does_not_count_an_attempt(self):
+        jobs.enqueue(['photos/a.jpg'])
+        jobs.release([self.claim_one()])
+        row = ImageJob.objects.get()
+        self.assertEqual((row.status, row.attempts, row.locked_at), (ImageJob.PENDING, 0, None))
+
+    def run_worker(self):
+        # threads instead of processes: same loop, and the test database stays open
+        with mock.patch.object(WorkerCommand, 'pool', lambda command, processes: ThreadPoolExecutor(processes)):
+            call_command('image_worker', once=True, processes=1, stdout=io.StringIO())
+
+    def test_worker_builds_queued_derivatives(self):
+        name = default_storage.save('photos/a.png', ContentFile(image_bytes((800, 600))))
+        jobs.enqueue([name, 'photos/missing.png'])
+        self.run_worker()
+        self.assertEqual(set(ImageJob.objects.values_list('status', flat=True)), {ImageJob.DONE})
+        rows = Derivative.objects.filter(source_name=name)
+        self.assertEqual(sorted(set(rows.values_list('width', flat=True))), [320, 640, 800])
+        self.assertTrue(all(default_storage.exists(path) for path in rows.values_list('name', flat=True)))
+
+        jobs.enqueue([name])
+        with mock.patch('images.derivatives.encode') as encode:
+            self.run_worker()
+        encode.assert_not_called()  # same bytes, nothing to rebuild
+
+    def test_worker_retries_a_failing_job(self):
+        jobs.enqueue(['photos/a.png'])
+        with mock.patch('images.derivatives.render', side_effect=OSError('broken decoder')):
+            self.run_worker()
+        row = ImageJob.objects.get()
+        self.assertEqual((row.status, row.attempts), (ImageJob.PENDING, 1))
+        self.assertIn('broken decoder', row.last_error)
+
+
+class DerivativeNameTests(MediaTestCase):
+    def test_encoder_settings_are_part_of_the_name(self):
+        name = default_storage.save('photos/a.png', ContentFile(image_bytes((800, 600))))
+        self.assertTrue(derivatives.generate(name))
+        before = set(Derivative.objects.values_list('name', flat=True))
+        self.assertFalse(derivatives.generate(name))
+
+        with mock.patch.dict(derivatives.QUALITY, webp=derivatives.QUALITY['webp'] - 10):
+            self.assertIsNone(derivatives.known_hash(name))
+            self.assertTrue(derivatives.generate(name))  # same source, other bytes: rebuilt under new names
+        after = set(Derivative.objects.filter(format='webp').values_list('name', flat=True))
+        self.assertFalse(after & before)
+
+
+class ServeTests(MediaTestCase):
+    def setUp(self):
+        super().setUp()
+        self.body = bytes(range(256)) * 4
+        self.name = default_storage.save('uploads/notes.bin', ContentFile(self.body))
+
+    def get(self, name=None, **headers):
+        response = self.client.get('/media/' + (name or self.name), headers=headers)
+        content = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, content
+
+    def test_whole_file(self):
+        response, content = self.get()
+        self.assertEqual((response.status_code, content), (200, self.body))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=%d' % MAX_AGE)
+        self.assertEqual(self.client.get('/media/uploads/missing.bin').status_code, 404)
+        self.assertEqual(self.client.get('/media/../secret').status_code, 404)
+
+    def test_single_range(self):
+        response, content = self.get(range='bytes=10-19')
+        self.assertEqual((response.status_code, content), (206, self.body[10:20]))
+        self.assertEqual((response['Content-Range'], response['Content-Length']), ('bytes 10-19/1024', '10'))
+
+        response, content = self.get(range='bytes=-100')
+        self.assertEqual((response.status_code, content), (206, self.body[-100:]))
+        self.assertEqual(response['Content-Range'], 'bytes 924-1023/1024')
+
+        response, content = self.get(range='bytes=1000-')
+        self.assertEqual((response.status_code, content), (206, self.body[1000:]))
+
+        response, content = self.get(range='bytes=0-1,5-6')  # several ranges: the whole file is a valid answer
+        self.assertEqual((response.status_code, content), (200, self.body))
+
+    def test_unsatisfiable_range(self):
+        for header in ('bytes=1024-', 'bytes=-0'):
+            with self.subTest(range=header):
+                response, content = self.get(range=header)
+                self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */1024'))
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, content = self.get(range='bytes=0-9', if_range=etag)
+        self.assertEqual((response.status_code, content), (206, self.body[:10]))
+        response, content = self.get(range='bytes=0-9', if_range='"an-older-copy"')
+        self.assertEqual((response.status_code, content), (200, self.body))
+        response, content = self.get(range='bytes=0-9', if_range=http_date(0))
+        self.assertEqual(response.status_code, 200)
+
+    def test_revalidation(self):
+        first = self.get()[0]
+        response, content = self.get(if_none_match=first['ETag'])
+        self.assertEqual((response.status_code, content), (304, b''))
+        self.assertEqual(response['ETag'], first['ETag'])
+        response = self.get(if_modified_since=first['Last-Modified'])[0]
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(self.get(if_none_match='"other"')[0].status_code, 200)
+
+    def test_content_addressed_files_are_immutable(self):
+        photo = default_storage.save('photos/a.png', ContentFile(image_bytes((800, 600))))
+        derivatives.generate(photo)
+        derivative = Derivative.objects.values_list('name', flat=True).first()
+        immutable = 'public, max-age=%d, immutable' % IMMUTABLE_MAX_AGE
+        for name in (photo, derivative):
+            with self.subTest(name=name):
+                response, content = self.get(name)
+                self.assertEqual((response.status_code, response['Cache-Control']), (200, immutable))
+                with default_storage.open(name) as stored:
+                    self.assertEqual(content, stored.read())
+                self.assertEqual(self.get(name, if_none_match=response['ETag'])[0].status_code, 304)
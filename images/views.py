@@ -0,0 +1,134 @@
+"""Serving MEDIA_ROOT from Django when no web server sits in front of it.
+
+Whole files go out as a FileResponse, which the WSGI server's file wrapper
+sends with ``sendfile`` (no copy through Python). A single byte range is
+answered with 206 (read in Python, as a bounded stream). Every response has
+an ETag and Last-Modified, so revalidation ends in a 304. Content-addressed
+files (images.storage, images.derivatives) never change under their name,
+so they are cached for a year as ``immutable``; the rest for MAX_AGE.
+
+With MEDIA_SENDFILE set, the proxy is told to send the file itself through
+``X-Accel-Redirect`` (nginx, internal location at MEDIA_ACCEL_PREFIX) or
+``X-Sendfile`` (Apache, lighttpd), and handles ranges on its own.
+"""
+import mimetypes
+import os
+import re
+import stat
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, quote_etag
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from images import derivatives
+
+MAX_AGE = 3600
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileRange:
+    """``length`` bytes of ``file`` from ``start``, as a file-like object for FileResponse."""
+
+    def __init__(self, file, start, length):
+        file.seek(start)
+        self.file, self.remaining = file, length
+
+    def read(self, size=-1):
+        size = self.remaining if size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def is_immutable(name):
+    content_addressed = getattr(default_storage, 'is_content_addressed', None)
+    return name.startswith(derivatives.DIRECTORY + '/') or bool(content_addressed and content_addressed(name))
+
+
+def byte_range(header, size):
+    """Inclusive ``(start, end)`` of a single-range header, None to send it all, False if unsatisfiable."""
+    match = RANGE_RE.match(header.strip())
+    if not match or match.groups() == ('', ''):
+        return None  # several ranges or garbage: a full 200 is a valid answer
+    first, last = match.groups()
+    if not first:
+        if not int(last):
+            return False
+        return max(0, size - int(last)), size - 1
+    start, end = int(first), int(last) if last else size - 1
+    if start >= size:
+        return False
+    if end < start:
+        return None
+    return start, min(end, size - 1)
+
+
+def file_response(request, path, name, size, etag, last_modified):
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    sendfile = getattr(settings, 'MEDIA_SENDFILE', '')
+    if sendfile == 'x-accel-redirect':
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + quote(name)
+        return response
+    if sendfile == 'x-sendfile':
+        response = HttpResponse(content_type=content_type)
+        response['X-Sendfile'] = path
+        return response
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = size
+        return response
+    span = None
+    if 'HTTP_RANGE' in request.META:
+        if_range = request.META.get('HTTP_IF_RANGE')
+        # a range of a file that changed since the client's copy would not fit it
+        if if_range is None or if_range in (etag, http_date(last_modified)):
+            span = byte_range(request.META['HTTP_RANGE'], size)
+    if span is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = 'bytes */%d' % size
+        return response
+    if span is None:
+        return FileResponse(open(path, 'rb'), content_type=content_type)
+    start, end = span
+    response = FileResponse(FileRange(open(path, 'rb'), start, end - start + 1), status=206, content_type=content_type)
+    response['Content-Range'] = 'bytes %d-%d/%d' % (start, end, size)
+    response['Content-Length'] = end - start + 1
+    return response
+
+
+@require_safe
+def serve(request, name):
+    try:
+        path = safe_join(settings.MEDIA_ROOT, name)
+        info = os.stat(path)
+    except (SuspiciousFileOperation, OSError, ValueError):
+        raise Http404
+    if not stat.S_ISREG(info.st_mode):
+        raise Http404
+    immutable = is_immutable(name)
+    if immutable:
+        etag = quote_etag(os.path.splitext(os.path.basename(name))[0])
+    else:
+        etag = quote_etag('%x-%x' % (info.st_mtime_ns, info.st_size))
+    last_modified = int(info.st_mtime)
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = file_response(request, path, name, info.st_size, etag, last_modified)
+    if response.status_code in (200, 206, 304):
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        response['Accept-Ranges'] = 'bytes'
+        response['Cache-Control'] = ('public, max-age=%d, immutable' % IMMUTABLE_MAX_AGE if immutable
+                                     else 'public, max-age=%d' % MAX_AGE)
+    return response
@@ -0,0 +1,240 @@
+"""In-process bitmap index over the structured listing attributes.
+
+One compressed bitmap of listing ids per attribute value (district, room
+type, room count, published flag). A search filter is a handful of AND/OR
+operations on those bitmaps; only the listings on the requested page are then
+read from the database. Service tags and subjects are served by the sorted
+posting lists of listings.postings, not here.
+
+Listing saves and deletes patch the index (see listings.signals); any other
+change bumps the shared data version and the index is rebuilt lazily by the
+next request that reads it. Requests read without the lock, so a patch never
+changes a dict or Bitmap in place: it builds new ones for what changed and
+swaps them in (copy on write).
+"""
+import sys
+import time
+from collections import defaultdict
+
+from listings import cache
+
+CHUNK_BITS = 16
+CHUNK_MASK = (1 << CHUNK_BITS) - 1
+
+# attributes held for every listing, one value each
+ATTRIBUTES = ('district', 'room_type', 'rooms', 'is_published')
+
+
+def bits_from_offsets(offsets):
+    buffer = bytearray(max(offsets) // 8 + 1)
+    for offset in offsets:
+        buffer[offset >> 3] |= 1 << (offset & 7)
+    return int.from_bytes(buffer, 'little')
+
+
+class Bitmap:
+    """Set of ids stored as 65536-bit chunks, empty chunks omitted.
+
+    Each chunk is a Python int, so AND/OR run at C speed and a sparse id space
+    (a few listings with very large ids) costs nothing for the gaps.
+    """
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_ids(cls, ids):
+        grouped = defaultdict(list)
+        for pk in ids:
+            grouped[pk >> CHUNK_BITS].append(pk & CHUNK_MASK)
+        return cls({key: bits_from_offsets(offsets) for key, offsets in grouped.items()})
+
+    def add(self, pk):
+        key = pk >> CHUNK_BITS
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << (pk & CHUNK_MASK))
+
+    def discard(self, pk):
+        key = pk >> CHUNK_BITS
+        chunk = self.chunks.get(key, 0) & ~(1 << (pk & CHUNK_MASK))
+        if chunk:
+            self.chunks[key] = chunk
+        else:
+            self.chunks.pop(key, None)
+
+    def __contains__(self, pk):
+        return bool(self.chunks.get(pk >> CHUNK_BITS, 0) >> (pk & CHUNK_MASK) & 1)
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = {}
+        for key, chunk in small.items():
+            both = chunk & large.get(key, 0)
+            if both:
+                chunks[key] = both
+        return Bitmap(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, chunk in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | chunk
+        return Bitmap(chunks)
+
+    def __sub__(self, other):
+        chunks = {}
+        for key, chunk in self.chunks.items():
+            rest = chunk & ~other.chunks.get(key, 0)
+            if rest:
+                chunks[key] = rest
+        return Bitmap(chunks)
+
+    def __len__(self):
+        return sum(chunk.bit_count() for chunk in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __iter__(self):
+        for key in sorted(self.chunks):
+            chunk, base = self.chunks[key], key << CHUNK_BITS
+            while chunk:
+                low = chunk & -chunk
+                yield base + low.bit_length() - 1
+                chunk ^= low
+
+    def nbytes(self):
+        return sys.getsizeof(self.chunks) + sum(sys.getsizeof(chunk) for chunk in self.chunks.values())
+
+
+def union(bitmaps):
+    result = Bitmap()
+    for bitmap in bitmaps:
+        result = result | bitmap
+    return result
+
+
+class BitmapIndex(cache.VersionedIndex):
+    def __init__(self):
+        super().__init__()
+        self.bitmaps = {name: {} for name in ATTRIBUTES}
+        self.rows = {}        # listing id -> attribute values, to clear bits on change
+        self.sort_keys = {}   # listing id -> (list_date timestamp, id) for newest-first ordering
+        self.all = Bitmap()
+        self.rebuild_seconds = None
+        self.built_at = None
+
+    def load(self, version):
+        from listings.models import Listing
+
+        started = time.perf_counter()
+        ids = {name: defaultdict(list) for name in ATTRIBUTES}
+        rows, sort_keys = {}, {}
+        columns = Listing.objects.values_list('id', 'district', 'room_type', 'room_count', 'is_published', 'list_date')
+        for pk, district, room_type, room_count, is_published, list_date in columns.iterator():
+            rows[pk] = {
+                'district': (district or '').lower(),
+                'room_type': (room_type or '').lower(),
+                'rooms': room_count,
+                'is_published': is_published,
+            }
+            sort_keys[pk] = (list_date.timestamp() if list_date else 0, pk)
+        for pk, row in rows.items():
+            for name in ATTRIBUTES:
+                ids[name][row[name]].append(pk)
+        self.bitmaps = {name: {value: Bitmap.from_ids(pks) for value, pks in ids[name].items()} for name in ATTRIBUTES}
+        self.rows, self.sort_keys, self.all = rows, sort_keys, Bitmap.from_ids(rows)
+        self.version = version
+        self.rebuild_seconds = time.perf_counter() - started
+        self.built_at = time.time()
+
+    def _replace(self, pk, row=None, sort_key=None):
+        """Swap in copies with ``pk`` removed and, given ``row``, added back; nothing is changed in place."""
+        rows, sort_keys, everything = dict(self.rows), dict(self.sort_keys), Bitmap(dict(self.all.chunks))
+        old = rows.pop(pk, None)
+        sort_keys.pop(pk, None)
+        everything.discard(pk)
+        bitmaps = {}
+        for name in ATTRIBUTES:
+            values = bitmaps[name] = dict(self.bitmaps[name])
+            if old is not None and old[name] in values:
+                values[old[name]] = Bitmap(dict(values[old[name]].chunks))
+                values[old[name]].discard(pk)
+            if row is not None:
+                values[row[name]] = Bitmap(dict(values.get(row[name], Bitmap()).chunks))
+                values[row[name]].add(pk)
+        if row is not None:
+            rows[pk], sort_keys[pk] = row, sort_key
+            everything.add(pk)
+        self.rows, self.sort_keys, self.bitmaps, self.all = rows, sort_keys, bitmaps, everything
+
+    def update(self, listing, version):
+        row = {
+            'district': (listing.district or '').lower(),
+            'room_type': (listing.room_type or '').lower(),
+            'rooms': listing.room_count,
+            'is_published': listing.is_published,
+        }
+        sort_key = (listing.list_date.timestamp() if listing.list_date else 0, listing.pk)
+        self._patch(version, lambda: self._replace(listing.pk, row, sort_key))
+
+    def remove(self, pk, version):
+        self._patch(version, lambda: self._replace(pk))
+
+    def get(self, name, value):
+        return self.bitmaps[name].get(value) or Bitmap()
+
+    def attribute_bitmap(self, name, value):
+        if name == 'rooms':
+            # the rooms filter is "at least n rooms"
+            minimum = int(value)
+            return union(bitmap for count, bitmap in self.bitmaps['rooms'].items() if count >= minimum)
+        return self.get(name, value)
+
+    def matching(self, filters, base=None, skip=None):
+        """Published listings matching every ``{attribute: value}`` filter."""
+        result = self.get('is_published', True)
+        if base is not None:
+            result = result & base
+        for name, value in filters.items():
+            if name == skip:
+                continue
+            result = result & self.attribute_bitmap(name, value)
+        return result
+
+    def facet_counts(self, facets, filters, base=None, rooms=()):
+        """``{facet: {value: count}}``, each facet counted under the other filters.
+
+        ``rooms`` are the minimums to count for the "at least n rooms" facet.
+        """
+        result = {}
+        for facet in facets:
+            matching = self.matching(filters, base, skip=facet)
+            if facet == 'rooms':
+                result[facet] = {key: len(matching & self.attribute_bitmap('rooms', key)) for key in rooms}
+            else:
+                result[facet] = {value: len(matching & bitmap) for value, bitmap in self.bitmaps[facet].items()}
+        return result
+
+    def ordered(self, bitmap):
+        """Ids of ``bitmap`` newest first, like ``order_by('-list_date', '-id')``.
+
+        ``bitmap`` may predate a patch that removed one of its ids; it sorts last
+        and the page fetch drops it.
+        """
+        sort_keys = self.sort_keys
+        return sorted(bitmap, key=lambda pk: sort_keys.get(pk, (0, pk)), reverse=True)
+
+    def stats(self):
+        bitmaps = [bitmap for values in self.bitmaps.values() for bitmap in values.values()]
+        return {
+            'version': self.version,
+            'listings': len(self.rows),
+            'bitmaps': len(bitmaps),
+            'bytes': sum(bitmap.nbytes() for bitmap in bitmaps) + self.all.nbytes(),
+            'rebuild_seconds': self.rebuild_seconds,
+            'built_at': self.built_at,
+            'values': {name: len(values) for name, values in self.bitmaps.items()},
+        }
+
+
+bitmap_index = BitmapIndex()
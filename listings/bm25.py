@@ -0,0 +1,197 @@
+"""In-process BM25 ranking for ``sort=relevance`` searches.
+
+Published listings are tokenized with listings.cjk and kept in an inverted
+index: per field, every term maps to two parallel arrays (document slots and
+term frequencies), and per-field document lengths are plain arrays indexed by
+slot. Scoring is BM25F with the field weights of listings.search.FIELDS, so
+a hit in the title outweighs one in the doctor name, the service tags and
+finally the description. Only the best ``limit`` documents are ordered, with
+a heap.
+
+Listing saves and tag/subject edits patch the index: the old slot is marked
+dead and the new version appended, and dead slots are squeezed out once they
+make up a quarter of the index. Doctor, tag and subject renames leave it to
+the lazy rebuild on the next data version.
+"""
+import heapq
+import math
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter
+
+from listings import cache, cjk, search
+
+K1 = 1.2
+B = 0.75
+FIELD_WEIGHTS = {name: weight for name, (_, weight) in search.FIELDS.items()}
+MAX_EXPANSIONS = 50   # dictionary terms a partially typed word may stand for
+
+
+class Corpus:
+    def __init__(self):
+        self.ids = array('q')                                  # slot -> listing id
+        self.live = bytearray()                                # slot -> 1 while current
+        self.slots = {}                                        # listing id -> live slot
+        self.lengths = {field: array('I') for field in FIELD_WEIGHTS}
+        self.total_lengths = dict.fromkeys(FIELD_WEIGHTS, 0)
+        self.postings = {field: {} for field in FIELD_WEIGHTS}  # field -> term -> (slots, frequencies)
+        self.vocabulary = None                                 # sorted terms, for prefix expansion
+        self.dead = 0
+
+    def add(self, pk, document):
+        slot = len(self.ids)
+        self.ids.append(pk)
+        self.live.append(1)
+        self.slots[pk] = slot
+        for field in FIELD_WEIGHTS:
+            tokens = cjk.index_tokens(document.get(field))
+            self.lengths[field].append(len(tokens))
+            self.total_lengths[field] += len(tokens)
+            for term, frequency in Counter(tokens).items():
+                if term not in self.postings[field]:
+                    self.postings[field][term] = (array('I'), array('H'))
+                    self.vocabulary = None
+                slots, frequencies = self.postings[field][term]
+                slots.append(slot)
+                frequencies.append(min(frequency, 0xFFFF))
+
+    def remove(self, pk):
+        slot = self.slots.pop(pk, None)
+        if slot is None:
+            return
+        self.live[slot] = 0
+        for field in FIELD_WEIGHTS:
+            self.total_lengths[field] -= self.lengths[field][slot]
+        self.dead += 1
+
+    def needs_compaction(self):
+        return self.dead > 100 and self.dead * 4 > len(self.ids)
+
+    def compacted(self):
+        corpus = Corpus()
+        renumber = {}
+        for slot, pk in enumerate(self.ids):
+            if self.live[slot]:
+                renumber[slot] = len(corpus.ids)
+                corpus.ids.append(pk)
+                corpus.live.append(1)
+                corpus.slots[pk] = renumber[slot]
+                for field in FIELD_WEIGHTS:
+                    corpus.lengths[field].append(self.lengths[field][slot])
+        corpus.total_lengths = dict(self.total_lengths)
+        for field, terms in self.postings.items():
+            for term, (slots, frequencies) in terms.items():
+                kept = [(renumber[slot], frequency) for slot, frequency in zip(slots, frequencies) if slot in renumber]
+                if kept:
+                    corpus.postings[field][term] = (array('I', (s for s, _ in kept)), array('H', (f for _, f in kept)))
+        return corpus
+
+    def expand(self, word, prefix):
+        if not prefix:
+            return [word]
+        if self.vocabulary is None:
+            self.vocabulary = sorted({term for terms in self.postings.values() for term in terms})
+        start = bisect_left(self.vocabulary, word)
+        expansions = []
+        for term in self.vocabulary[start:start + MAX_EXPANSIONS]:
+            if not term.startswith(word):
+                break
+            expansions.append(term)
+        return expansions
+
+    def term_scores(self, term):
+        """``{slot: score}`` of one term over all fields (BM25F)."""
+        averages = {field: (total / len(self.slots) if self.slots else 0) or 1 for field, total in self.total_lengths.items()}
+        weighted = {}
+        for field, weight in FIELD_WEIGHTS.items():
+            posting = self.postings[field].get(term)
+            if posting is None:
+                continue
+            lengths, average = self.lengths[field], averages[field]
+            for slot, frequency in zip(*posting):
+                if self.live[slot]:
+                    norm = 1 - B + B * lengths[slot] / average
+                    weighted[slot] = weighted.get(slot, 0.0) + weight * frequency / norm
+        total = len(self.slots)
+        idf = math.log(1 + (total - len(weighted) + 0.5) / (len(weighted) + 0.5))
+        return {slot: idf * tf / (K1 + tf) for slot, tf in weighted.items()}
+
+    def scores(self, keywords):
+        """``{listing id: score}`` for listings matching every word of ``keywords``."""
+        result = None
+        for word, prefix in search.terms(keywords):
+            best = {}
+            for term in self.expand(word, prefix):
+                for slot, score in self.term_scores(term).items():
+                    if score > best.get(slot, -1.0):
+                        best[slot] = score
+            if result is None:
+                result = best
+            else:
+                result = {slot: score + best[slot] for slot, score in result.items() if slot in best}
+            if not result:
+                return {}
+        return {self.ids[slot]: score for slot, score in (result or {}).items()}
+
+
+class RankIndex(cache.VersionedIndex):
+    def __init__(self):
+        super().__init__()
+        self.corpus = Corpus()
+        self.rebuild_seconds = None
+
+    def load(self, version):
+        from listings.models import Listing
+
+        started = time.perf_counter()
+        corpus = Corpus()
+        listings = (Listing.objects.filter(is_published=True)
+                    .select_related('doctor').prefetch_related('services', 'professionals'))
+        for listing in listings.iterator(chunk_size=500):
+            corpus.add(listing.pk, search.document_for(listing))
+        self.corpus = corpus
+        self.version = version
+        self.rebuild_seconds = time.perf_counter() - started
+
+    def update(self, listing, document, version):
+        def apply():
+            self.corpus.remove(listing.pk)
+            if listing.is_published:
+                self.corpus.add(listing.pk, document)
+            if self.corpus.needs_compaction():
+                self.corpus = self.corpus.compacted()
+        self._patch(version, apply)
+
+    def remove(self, pk, version):
+        self._patch(version, lambda: self.corpus.remove(pk))
+
+    def matches(self, keywords):
+        return sorted(self.corpus.scores(keywords))
+
+    def top(self, keywords, allowed=None, limit=None):
+        """``(ids, total)``: the best ``limit`` matches, highest score first.
+
+        ``allowed`` (a Bitmap or set of ids) restricts the candidates, e.g. to
+        the listings passing the structured filters.
+        """
+        scores = self.corpus.scores(keywords)
+        if allowed is not None:
+            scores = {pk: score for pk, score in scores.items() if pk in allowed}
+        key = lambda pk: (scores[pk], pk)  # ties: newer ids first
+        if limit is None or limit >= len(scores):
+            return sorted(scores, key=key, reverse=True), len(scores)
+        return heapq.nlargest(limit, scores, key=key), len(scores)
+
+    def stats(self):
+        corpus = self.corpus
+        return {
+            'version': self.version,
+            'documents': len(corpus.slots),
+            'dead': corpus.dead,
+            'terms': sum(len(terms) for terms in corpus.postings.values()),
+            'rebuild_seconds': self.rebuild_seconds,
+        }
+
+
+rank_index = RankIndex()
@@ -0,0 +1,139 @@
+"""Search result cache and the shared data version.
+
+Results are stored as the ordered list of matching listing ids plus the total,
+keyed by the normalized query string and a global data version. Any change to
+listings, doctors, subjects or tags bumps the version once its transaction
+commits (see listings.signals), which orphans every cached result at once instead of hunting down keys. The
+same version tells the in-process indexes (VersionedIndex) when to rebuild;
+indexes that only depend on names follow the narrower vocabulary version.
+"""
+import hashlib
+import threading
+import time
+
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.datastructures import MultiValueDict
+from django.utils.http import urlencode
+
+VERSION_KEY = 'listings:data_version'
+VOCABULARY_KEY = 'listings:vocabulary_version'  # doctor, tag and subject names
+LISTING_VERSION_KEY = 'listings:listing_version:%s'  # detail page fragments of one listing
+DELETIONS_KEY = 'listings:deletions:%s'  # per model label; Max(updated_at) does not move on a delete
+SEARCH_PARAMS = ('keywords', 'district', 'rooms', 'room_type', 'services', 'professionals', 'sort')
+RESULT_TIMEOUT = 60 * 10
+
+
+def initial_version():
+    # a counter lost to cache eviction restarts above every value it handed out
+    return time.time_ns() // 1000
+
+
+def data_version(key=VERSION_KEY):
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, initial_version(), None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_version(key=VERSION_KEY):
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.add(key, initial_version(), None)
+        return cache.incr(key)
+
+
+def listing_version(pk):
+    # versions are timestamps, so an evicted key never comes back as an old version
+    key = LISTING_VERSION_KEY % pk
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_listing_versions(pks):
+    # after the commit, or a fragment rendered in between caches the old rows under the new version
+    keys = [LISTING_VERSION_KEY % pk for pk in pks]
+    transaction.on_commit(lambda: cache.set_many(dict.fromkeys(keys, time.time_ns()), None))
+
+
+def deletions(model):
+    return data_version(DELETIONS_KEY % model._meta.label_lower)
+
+
+def count_deletion(model):
+    transaction.on_commit(lambda: bump_version(DELETIONS_KEY % model._meta.label_lower))
+
+
+def normalize_params(params, names=SEARCH_PARAMS):
+    """Lower-cased, whitespace-collapsed, sorted (name, value) pairs; empty values dropped."""
+    normalized = []
+    for name in sorted(names):
+        for value in params.getlist(name) if hasattr(params, 'getlist') else [params.get(name)]:
+            value = ' '.join((value or '').split()).lower()
+            if value:
+                normalized.append((name, value))
+    return tuple(normalized)
+
+
+def as_query(params):
+    """Normalized pairs back into a dict-like with ``get``/``getlist``."""
+    query = MultiValueDict()
+    for name, value in params:
+        query.appendlist(name, value)
+    return query
+
+
+def result_key(params, version=None):
+    digest = hashlib.md5(urlencode(params).encode()).hexdigest()
+    return 'listings:search:%s:%s' % (version or data_version(), digest)
+
+
+def cached_results(params, compute):
+    """Return ``(ids, total)`` for ``params``, calling ``compute()`` on a miss."""
+    key = result_key(params)
+    results = cache.get(key)
+    if results is None:
+        results = compute()
+        cache.set(key, results, RESULT_TIMEOUT)
+    return results
+
+
+class VersionedIndex:
+    """Base for per-process indexes built from the database.
+
+    ``current()`` rebuilds the index whenever the shared data version moved
+    since it was loaded. Signal handlers in this process can instead patch it
+    through ``_patch`` so their own writes do not force a full rebuild.
+    """
+    version_key = VERSION_KEY
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+
+    def load(self, version):
+        raise NotImplementedError
+
+    def current(self):
+        version = data_version(self.version_key)
+        if self.version != version:
+            with self.lock:
+                if self.version != version:
+                    self.load(version)
+        return self
+
+    def _patch(self, version, apply):
+        # only patch an index that was current right before this change
+        with self.lock:
+            if self.version is not None and self.version == version - 1:
+                apply()
+                self.version = version
+
+    def touch(self, version):
+        # a change that does not affect this index
+        self._patch(version, lambda: None)
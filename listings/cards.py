@@ -0,0 +1,24 @@
+"""The ListingCard read model behind the index, listings and search pages.
+
+A card copies the handful of Listing columns the templates render, plus the
+doctor's name and the main photo URL, so a page of cards is one SELECT on a
+narrow table instead of full Listing rows and a doctor query per card.
+"""
+CARD_FIELDS = ('title', 'district', 'service', 'screen', 'professional', 'rooms', 'is_published', 'list_date')
+
+
+def card_values(listing, doctor_name):
+    values = {field: getattr(listing, field) for field in CARD_FIELDS}
+    values['doctor_name'] = doctor_name
+    values['photo_main_url'] = listing.photo_main.url if listing.photo_main else ''
+    return values
+
+
+def update_card(listing):
+    from listings.models import ListingCard
+    ListingCard.objects.update_or_create(listing_id=listing.pk, defaults=card_values(listing, listing.doctor.name))
+
+
+def doctor_renamed(doctor):
+    from listings.models import ListingCard
+    ListingCard.objects.filter(listing__doctor=doctor).update(doctor_name=doctor.name)
@@ -0,0 +1,67 @@
+"""Tokenizer for the mixed Chinese/English text in listings.
+
+Chinese has no spaces between words, so CJK runs are cut into overlapping
+character n-grams while latin words and numbers stay whole. Text is folded
+first (NFKC, lower case, Traditional -> Simplified) so that 醫生 and 医生,
+or full-width and half-width letters, produce the same tokens.
+"""
+import re
+import unicodedata
+
+from listings.cjk_variants import SIMPLIFIED, TRADITIONAL
+
+VARIANTS = str.maketrans(TRADITIONAL, SIMPLIFIED)
+
+# CJK unified ideographs (+ extension A) and the compatibility block
+CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+TOKEN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[^\W_㐀-䶿一-鿿豈-﫿]+')
+
+INDEX_NGRAMS = (1, 2, 3)
+
+
+def fold(text):
+    return unicodedata.normalize('NFKC', text or '').lower().translate(VARIANTS)
+
+
+def is_cjk(token):
+    return CJK_RUN.fullmatch(token) is not None
+
+
+def ngrams(run, n):
+    if len(run) <= n:
+        return [run] if len(run) == n else []
+    return [run[i:i + n] for i in range(len(run) - n + 1)]
+
+
+def index_tokens(text):
+    """All tokens a piece of text should be findable by."""
+    tokens = []
+    for match in TOKEN.finditer(fold(text)):
+        run = match.group()
+        if is_cjk(run):
+            for n in INDEX_NGRAMS:
+                tokens.extend(ngrams(run, n))
+        else:
+            tokens.append(run)
+    return tokens
+
+
+def query_tokens(text):
+    """Tokens that must all be present for a document to match ``text``.
+
+    A CJK run is covered by its longest indexed n-grams, so 安心診所 needs
+    安心诊 + 心诊所 rather than four loose characters.
+    """
+    tokens = []
+    for match in TOKEN.finditer(fold(text)):
+        run = match.group()
+        if is_cjk(run):
+            n = min(len(run), max(INDEX_NGRAMS))
+            tokens.extend(ngrams(run, n))
+        else:
+            tokens.append(run)
+    return list(dict.fromkeys(tokens))
+
+
+def index_text(text):
+    return ' '.join(index_tokens(text))
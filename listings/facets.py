@@ -0,0 +1,35 @@
+"""Facet options for the search form.
+
+Only turns request parameters into bitmap index filters and the index's
+counts into option lists; the counting itself ("how many listings in Sha Tin
+also match the other filters", an AND and a popcount instead of a GROUP BY)
+is ``BitmapIndex.facet_counts`` in listings.bitmap.
+"""
+from listings.bitmap import Bitmap, bitmap_index
+from listings.choices import district_choices, room_choices, rooms_choices
+
+FACETS = ('district', 'room_type', 'rooms')
+
+
+def facet_filters(params):
+    filters = {}
+    for facet in FACETS:
+        value = params.get(facet)
+        if value and (facet != 'rooms' or value.isdecimal()):
+            filters[facet] = value
+    return filters
+
+
+def search_facets(params, base_ids=None):
+    """Option lists for the search form as ``(key, label, count)`` tuples.
+
+    ``base_ids`` restricts the counts to listings already matched by the
+    non-facet part of the query (keywords, tags, subjects).
+    """
+    base = Bitmap.from_ids(base_ids) if base_ids is not None else None
+    found = bitmap_index.current().facet_counts(FACETS, facet_filters(params), base, rooms=rooms_choices)
+    return {
+        'district': [(key, label, found['district'].get(key.lower(), 0)) for key, label in district_choices.items()],
+        'room_type': [(key, label, found['room_type'].get(key.lower(), 0)) for key, label in room_choices.items()],
+        'rooms': [(key, label, found['rooms'].get(key, 0)) for key, label in rooms_choices.items()],
+    }
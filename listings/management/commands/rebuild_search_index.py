@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from listings import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text search index for all listings'
+
+    def handle(self, *args, **options):
+        search.drop_index(connection)
+        search.create_index(connection)
+        count = search.rebuild()
+        self.stdout.write(self.style.SUCCESS('Indexed %d listings' % count))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from listings.bitmap import bitmap_index
+from listings.bm25 import rank_index
+from listings.suggest import suggest_index
+
+
+class Command(BaseCommand):
+    help = 'Build the in-process search indexes and print their size and rebuild time'
+
+    def handle(self, *args, **options):
+        stats = bitmap_index.current().stats()
+        self.stdout.write('version          %s' % stats['version'])
+        self.stdout.write('listings         %d' % stats['listings'])
+        self.stdout.write('bitmaps          %d' % stats['bitmaps'])
+        self.stdout.write('memory           %.1f KiB' % (stats['bytes'] / 1024))
+        self.stdout.write('rebuild          %.2f ms' % (stats['rebuild_seconds'] * 1000))
+        for name, count in stats['values'].items():
+            self.stdout.write('  %-14s %d values' % (name, count))
+
+        stats = suggest_index.current().stats()
+        self.stdout.write('suggestions      %d entries, %d trie nodes, rebuild %.2f ms'
+                          % (stats['entries'], stats['nodes'], stats['rebuild_seconds'] * 1000))
+        stats = rank_index.current().stats()
+        self.stdout.write('bm25             %d documents (%d dead), %d terms, rebuild %.2f ms'
+                          % (stats['documents'], stats['dead'], stats['terms'], stats['rebuild_seconds'] * 1000))
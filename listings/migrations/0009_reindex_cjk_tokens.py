@@ -0,0 +1,80 @@
+import re
+import unicodedata
+from collections import defaultdict
+
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import Value
+
+# The tokenizer as it was when this migration was written (listings.cjk), so
+# later changes to it cannot change what this migration stores. The variant
+# table is data only and is read from listings.cjk_variants.
+from listings.cjk_variants import SIMPLIFIED, TRADITIONAL
+
+VARIANTS = str.maketrans(TRADITIONAL, SIMPLIFIED)
+CJK_RUN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+')
+TOKEN = re.compile(r'[㐀-䶿一-鿿豈-﫿]+|[^\W_㐀-䶿一-鿿豈-﫿]+')
+FIELDS = (('title', 'A'), ('doctor', 'B'), ('services', 'B'), ('professionals', 'C'), ('description', 'D'))
+
+
+def index_text(text):
+    tokens = []
+    for match in TOKEN.finditer(unicodedata.normalize('NFKC', text or '').lower().translate(VARIANTS)):
+        run = match.group()
+        if CJK_RUN.fullmatch(run):
+            for n in (1, 2, 3):
+                tokens.extend(run[i:i + n] for i in range(len(run) - n + 1))
+        else:
+            tokens.append(run)
+    return ' '.join(tokens)
+
+
+def reindex(apps, schema_editor):
+    # the only backfill: documents written by an earlier 0008 were whitespace tokenized
+    connection = schema_editor.connection
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    alias = connection.alias
+    Listing = apps.get_model('listings', 'Listing')
+    SearchDocument = apps.get_model('listings', 'SearchDocument')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    tags = defaultdict(list)
+    content_type = ContentType.objects.using(alias).filter(app_label='listings', model='listing').first()
+    if content_type is not None:
+        tagged = TaggedItem.objects.using(alias).filter(content_type=content_type).values_list('object_id', 'tag__name')
+        for listing_id, name in tagged:
+            tags[listing_id].append(name)
+    listings = Listing.objects.using(alias).select_related('doctor').prefetch_related('professionals')
+    for listing in listings.iterator(chunk_size=200):
+        document = {
+            'title': listing.title,
+            'doctor': listing.doctor.name,
+            'services': ' '.join(tags[listing.pk]),
+            'professionals': ' '.join(subject.name for subject in listing.professionals.all()),
+            'description': listing.description,
+        }
+        texts = [index_text(document[name]) for name, _ in FIELDS]
+        if connection.vendor == 'postgresql':
+            vector = None
+            for text, (_, weight) in zip(texts, FIELDS):
+                part = SearchVector(Value(text), config='simple', weight=weight)
+                vector = part if vector is None else vector + part
+            SearchDocument.objects.using(alias).update_or_create(listing_id=listing.pk, defaults={'vector': vector})
+        else:
+            with connection.cursor() as cursor:
+                cursor.execute('DELETE FROM listings_search_fts WHERE rowid = %s', [listing.pk])
+                cursor.execute(
+                    'INSERT INTO listings_search_fts (rowid, title, doctor, services, professionals, description) '
+                    'VALUES (%s, %s, %s, %s, %s, %s)', [listing.pk] + texts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0008_searchdocument'),
+    ]
+
+    operations = [
+        migrations.RunPython(reindex, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:04
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0002_doctor_phone'),
+        ('listings', '0009_reindex_cjk_tokens'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-list_date', '-id'], name='listing_published_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.functions.text.Lower('district'), django.db.models.functions.text.Lower('room_type'), models.OrderBy(models.F('list_date'), descending=True), condition=models.Q(('is_published', True)), name='listing_district_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(django.db.models.functions.text.Lower('room_type'), models.OrderBy(models.F('list_date'), descending=True), condition=models.Q(('is_published', True)), name='listing_room_type_idx'),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:05
+
+from django.db import migrations, models
+
+
+def backfill_room_count(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    for rooms in Listing.objects.values_list('rooms', flat=True).distinct():
+        if rooms and rooms.isdigit():
+            Listing.objects.filter(rooms=rooms).update(room_count=int(rooms))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('doctors', '0002_doctor_phone'),
+        ('listings', '0010_listing_search_indexes'),
+        ('taggit', '0006_rename_taggeditem_content_type_object_id_taggit_tagg_content_8fc721_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='room_count',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_room_count, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='listing',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['room_count', '-list_date'], name='listing_room_count_idx'),
+        ),
+    ]
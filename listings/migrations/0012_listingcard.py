@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-17 12:17
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+# the card columns as of this migration, frozen: listings.cards may change later
+CARD_FIELDS = ('title', 'district', 'service', 'screen', 'professional', 'rooms', 'is_published', 'list_date')
+
+
+def create_cards(apps, schema_editor):
+    Listing = apps.get_model('listings', 'Listing')
+    ListingCard = apps.get_model('listings', 'ListingCard')
+    db = schema_editor.connection.alias
+    cards = []
+    for listing in Listing.objects.using(db).select_related('doctor').iterator(chunk_size=500):
+        values = {field: getattr(listing, field) for field in CARD_FIELDS}
+        cards.append(ListingCard(
+            listing_id=listing.pk, doctor_name=listing.doctor.name,
+            photo_main_url=listing.photo_main.url if listing.photo_main else '', **values))
+    ListingCard.objects.using(db).bulk_create(cards, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('listings', '0011_listing_room_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingCard',
+            fields=[
+                ('listing', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='card', serialize=False, to='listings.listing')),
+                ('title', models.CharField(max_length=200)),
+                ('district', models.CharField(max_length=50)),
+                ('service', models.IntegerField()),
+                ('screen', models.IntegerField()),
+                ('professional', models.IntegerField()),
+                ('rooms', models.CharField(max_length=2)),
+                ('doctor_name', models.CharField(max_length=200)),
+                ('photo_main_url', models.CharField(blank=True, max_length=500)),
+                ('is_published', models.BooleanField(default=True)),
+                ('list_date', models.DateTimeField()),
+            ],
+            options={
+                'ordering': ('-list_date',),
+                'indexes': [models.Index(condition=models.Q(('is_published', True)), fields=['-list_date', '-listing'], name='listingcard_published_idx')],
+            },
+        ),
+        migrations.RunPython(create_cards, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,11 @@
 from django.db import models
+from django.db.models import F, Q
+from django.db.models.functions import Lower
 from datetime import datetime
 from doctors.models import Doctor
 from listings.choices import district_choices, rooms_choices, room_choices
 from taggit.managers import TaggableManager
+from django.contrib.postgres.search import SearchVectorField
 # Create your models here.
 class Subject(models.Model):
     name = models.CharField(max_length=200)
@@ -22,6 +25,7 @@ class Listing(models.Model):
     professionals = models.ManyToManyField(Subject, blank=True)
     professional = models.IntegerField()
     rooms = models.CharField(max_length=2, choices=rooms_choices.items())
+    room_count = models.PositiveSmallIntegerField(default=0, editable=False) # numeric copy of rooms for range filters
     photo_main = models.ImageField(upload_to='photos/%Y/%m/%d/', blank=True)
     photo_1 = models.ImageField(upload_to='photos/%Y/%m/%d/', blank=True)
     photo_2 = models.ImageField(upload_to='photos/%Y/%m/%d/', blank=True)
@@ -31,14 +35,61 @@ class Listing(models.Model):
     photo_6 = models.ImageField(upload_to='photos/%Y/%m/%d/', blank=True)
     is_published = models.BooleanField(default=True)
     list_date = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True) # version stamp for conditional GETs, also touched by listings.signals
     
     class Meta:
         ordering = ('-list_date',) # - = descending order
-        indexes = [models.Index(fields=['list_date'])]
+        indexes = [
+            models.Index(fields=['list_date']),
+            # the public pages only ever read published listings, newest first
+            models.Index(fields=['-list_date', '-id'], name='listing_published_date_idx', condition=Q(is_published=True)),
+            # search filters match on lower(district) / lower(room_type), see listings.views.search
+            models.Index(Lower('district'), Lower('room_type'), F('list_date').desc(), name='listing_district_type_idx', condition=Q(is_published=True)),
+            models.Index(Lower('room_type'), F('list_date').desc(), name='listing_room_type_idx', condition=Q(is_published=True)),
+            models.Index(fields=['room_count', '-list_date'], name='listing_room_count_idx', condition=Q(is_published=True)),
+            models.Index(fields=['updated_at'], name='listing_updated_at_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        self.room_count = int(self.rooms) if str(self.rooms).isdigit() else 0
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'rooms' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'room_count'}
+        super().save(*args, **kwargs)
 
     def __str__(self):
         return self.title
 
     def tag_list(self):
         return u', '.join(tag.name for tag in self.services.all())
-    
\ No newline at end of file
+
+class SearchDocument(models.Model):
+    # weighted tsvector kept in sync by listings.signals (GIN index added in migration 0008 on postgres)
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='search_document')
+    vector = SearchVectorField(null=True)
+
+    def __str__(self):
+        return str(self.listing)
+
+class ListingCard(models.Model):
+    # what the listing cards render, one narrow row per listing; kept in sync by listings.signals
+    listing = models.OneToOneField(Listing, on_delete=models.CASCADE, primary_key=True, related_name='card')
+    title = models.CharField(max_length=200)
+    district = models.CharField(max_length=50)
+    service = models.IntegerField()
+    screen = models.IntegerField()
+    professional = models.IntegerField()
+    rooms = models.CharField(max_length=2)
+    doctor_name = models.CharField(max_length=200)
+    photo_main_url = models.CharField(max_length=500, blank=True)
+    is_published = models.BooleanField(default=True)
+    list_date = models.DateTimeField()
+
+    class Meta:
+        ordering = ('-list_date',)
+        indexes = [
+            models.Index(fields=['-list_date', '-listing'], name='listingcard_published_idx', condition=Q(is_published=True)),
+        ]
+
+    def __str__(self):
+        return self.title
@@ -0,0 +1,252 @@
+"""Keyset (cursor) pagination.
+
+Instead of ``OFFSET n`` plus ``COUNT(*)`` each page is fetched with a WHERE
+clause on the sort keys of the last row seen, e.g.
+``(list_date, id) < (:last_date, :last_id)``, so page 500 costs the same
+index range scan as page 1. Cursors are opaque url-safe tokens.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Q
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_value(value):
+    if isinstance(value, datetime):
+        return {'dt': value.isoformat()}
+    if isinstance(value, date):
+        return {'d': value.isoformat()}
+    return value
+
+
+def decode_value(value):
+    if isinstance(value, dict):
+        if 'dt' in value:
+            return parse_datetime(value['dt'])
+        if 'd' in value:
+            return parse_date(value['d'])
+        raise InvalidCursor(value)
+    if isinstance(value, list):
+        raise InvalidCursor(value)
+    return value
+
+
+def encode_cursor(values, direction):
+    payload = json.dumps({'k': [encode_value(v) for v in values], 'd': direction}, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        values = [decode_value(v) for v in payload['k']]
+        direction = payload['d']
+    except (ValueError, TypeError, KeyError) as exc:
+        raise InvalidCursor(token) from exc
+    if direction not in ('n', 'p') or any(v is None for v in values):
+        raise InvalidCursor(token)
+    return values, direction
+
+
+def estimate_count(queryset):
+    """Planner row estimate on postgres (no scan), exact count elsewhere."""
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count()
+
+
+class CursorPage:
+    def __init__(self, object_list, paginator, has_next, has_previous, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.has_next = has_next
+        self.has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    @property
+    def estimated_total(self):
+        return self.paginator.estimated_total
+
+
+class KeysetPaginator:
+    """Paginate an ordered queryset by its sort keys.
+
+    ``keys`` defaults to the queryset's own ``order_by`` with ``-id`` appended
+    as a tie breaker; every key must be a plain field or annotation name.
+    """
+
+    def __init__(self, queryset, per_page, keys=None, estimate_total=False):
+        if keys is None:
+            keys = [key for key in queryset.query.order_by]
+            if not any(key.lstrip('-') in ('id', 'pk') for key in keys):
+                keys.append('-id')
+        for key in keys:
+            if not isinstance(key, str):
+                raise ValueError('KeysetPaginator only supports named sort keys, got %r' % (key,))
+        self.keys = tuple(keys)
+        self.fields = tuple(key.lstrip('-') for key in self.keys)
+        self.queryset = queryset.order_by(*self.keys)
+        self.model_fields = tuple(self.model_field(field) for field in self.fields)
+        self.per_page = int(per_page)
+        self.estimate_total = estimate_total
+        self._estimated_total = None
+
+    def model_field(self, name):
+        opts = self.queryset.model._meta
+        if name == 'pk':
+            return opts.pk
+        try:
+            return opts.get_field(name)
+        except FieldDoesNotExist:
+            return None  # an annotation, compared as decoded
+
+    def clean_values(self, values):
+        """Cursor values coerced to the key fields' types; a tampered cursor raises InvalidCursor."""
+        if len(values) != len(self.keys):
+            raise InvalidCursor(values)
+        cleaned = []
+        for field, value in zip(self.model_fields, values):
+            if field is not None:
+                try:
+                    value = field.to_python(value)
+                except (ValidationError, TypeError, ValueError) as exc:
+                    raise InvalidCursor(values) from exc
+            if value is None:
+                raise InvalidCursor(values)
+            cleaned.append(value)
+        return cleaned
+
+    @property
+    def estimated_total(self):
+        if not self.estimate_total:
+            return None
+        if self._estimated_total is None:
+            self._estimated_total = estimate_count(self.queryset)
+        return self._estimated_total
+
+    def seek(self, values, forward):
+        """Rows strictly after (forward) or before the row with ``values``."""
+        condition = Q()
+        for i, key in enumerate(self.keys):
+            descending = key.startswith('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            clause = Q(**{'%s__%s' % (self.fields[i], lookup): values[i]})
+            for j in range(i):
+                clause &= Q(**{self.fields[j]: values[j]})
+            condition |= clause
+        # redundant bound on the leading key so the planner can range scan the index
+        leading = 'lte' if self.keys[0].startswith('-') == forward else 'gte'
+        return Q(**{'%s__%s' % (self.fields[0], leading): values[0]}) & condition
+
+    def key_values(self, obj):
+        return [getattr(obj, field) for field in self.fields]
+
+    def get_page(self, cursor=None):
+        values, direction = None, 'n'
+        if cursor:
+            try:
+                values, direction = decode_cursor(cursor)
+                values = self.clean_values(values)
+            except InvalidCursor:
+                values, direction = None, 'n'
+        forward = direction == 'n'
+        queryset = self.queryset
+        if values is not None:
+            queryset = queryset.filter(self.seek(values, forward))
+        if not forward:
+            queryset = queryset.reverse()
+        rows = list(queryset[:self.per_page + 1])
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if not forward:
+            rows.reverse()
+        if forward:
+            has_next, has_previous = more, values is not None
+        else:
+            has_next, has_previous = True, more
+        next_cursor = encode_cursor(self.key_values(rows[-1]), 'n') if rows and has_next else None
+        previous_cursor = encode_cursor(self.key_values(rows[0]), 'p') if rows and has_previous else None
+        return CursorPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
+
+
+class IdListPaginator:
+    """Cursor pagination over an already ordered list of ids (e.g. a cached result).
+
+    ``fetch`` turns a list of ids into ``{id: object}``, typically
+    ``queryset.in_bulk``, so only the rows on the page are loaded. Cursors
+    carry the id and its position, so ``offset`` tells how deep a page is
+    before the list is built, and ``ids`` may stop shortly after the page
+    (e.g. a heap top-k) while ``total`` counts every hit.
+    """
+
+    def __init__(self, ids, per_page, fetch, total=None):
+        self.ids = list(ids)
+        self.per_page = int(per_page)
+        self.fetch = fetch
+        self.estimated_total = len(self.ids) if total is None else total
+
+    @staticmethod
+    def offset(cursor):
+        """Position the cursor was taken at, 0 if there is none or it is not readable."""
+        try:
+            values, direction = decode_cursor(cursor) if cursor else ([], 'n')
+        except InvalidCursor:
+            return 0
+        hint = values[1] if len(values) == 2 else 0
+        return hint if isinstance(hint, int) and not isinstance(hint, bool) and hint >= 0 else 0
+
+    def position(self, cursor):
+        try:
+            values, direction = decode_cursor(cursor)
+            hint = self.offset(cursor)
+            if hint < len(self.ids) and self.ids[hint] == values[0]:
+                return hint, direction
+            return self.ids.index(values[0]), direction
+        except (InvalidCursor, IndexError, ValueError):
+            return None, 'n'
+
+    def get_page(self, cursor=None):
+        start, end = 0, self.per_page
+        position, direction = self.position(cursor) if cursor else (None, 'n')
+        if position is not None:
+            if direction == 'n':
+                start, end = position + 1, position + 1 + self.per_page
+            else:
+                start, end = max(position - self.per_page, 0), position
+        page_ids = self.ids[start:end]
+        objects = self.fetch(page_ids) if page_ids else {}
+        rows = [objects[pk] for pk in page_ids if pk in objects]
+        has_previous, has_next = start > 0, end < len(self.ids)
+        next_cursor = encode_cursor([page_ids[-1], end - 1], 'n') if page_ids and has_next else None
+        previous_cursor = encode_cursor([page_ids[0], start], 'p') if page_ids and has_previous else None
+        return CursorPage(rows, self, has_next, has_previous, next_cursor, previous_cursor)
@@ -0,0 +1,136 @@
+"""Full-text index for the listing search page.
+
+On PostgreSQL every listing has a SearchDocument row holding a weighted
+tsvector (GIN indexed). SQLite has no tsvector, so the same columns are kept
+in an FTS5 virtual table instead, which lets the search page run against a
+local database.
+
+Both indexes store text already run through listings.cjk, so Chinese titles
+and names are matched by n-grams and Simplified/Traditional forms agree.
+"""
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, IntegerField, Q, Value
+from django.db.models.functions import Cast
+
+from listings import cjk
+
+FTS_TABLE = 'listings_search_fts'
+
+# column -> (postgres weight, sqlite bm25 weight)
+FIELDS = {
+    'title': ('A', 10.0),
+    'doctor': ('B', 5.0),
+    'services': ('B', 4.0),
+    'professionals': ('C', 3.0),
+    'description': ('D', 1.0),
+}
+
+
+# ranks are stored as scaled integers so they compare exactly in keyset cursors
+RANK_SCALE = 1000000
+
+
+def is_postgres(conn=None):
+    return (conn or connection).vendor == 'postgresql'
+
+
+def create_index(conn):
+    with conn.cursor() as cursor:
+        if is_postgres(conn):
+            cursor.execute(
+                'CREATE INDEX IF NOT EXISTS listings_searchdocument_vector_gin '
+                'ON listings_searchdocument USING gin (vector)')
+        elif conn.vendor == 'sqlite':
+            cursor.execute(
+                'CREATE VIRTUAL TABLE IF NOT EXISTS %s USING fts5(%s)' % (FTS_TABLE, ', '.join(FIELDS)))
+
+
+def drop_index(conn):
+    with conn.cursor() as cursor:
+        if is_postgres(conn):
+            cursor.execute('DROP INDEX IF EXISTS listings_searchdocument_vector_gin')
+        elif conn.vendor == 'sqlite':
+            cursor.execute('DROP TABLE IF EXISTS %s' % FTS_TABLE)
+
+
+def document_for(listing):
+    return {
+        'title': listing.title,
+        'doctor': listing.doctor.name,
+        'services': ' '.join(tag.name for tag in listing.services.all()),
+        'professionals': ' '.join(subject.name for subject in listing.professionals.all()),
+        'description': listing.description,
+    }
+
+
+def index_document(listing_id, document):
+    if is_postgres():
+        from listings.models import SearchDocument
+        vector = None
+        for name, (weight, _) in FIELDS.items():
+            part = SearchVector(Value(cjk.index_text(document.get(name))), config='simple', weight=weight)
+            vector = part if vector is None else vector + part
+        SearchDocument.objects.update_or_create(listing_id=listing_id, defaults={'vector': vector})
+    elif connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [listing_id])
+            cursor.execute(
+                'INSERT INTO %s (rowid, %s) VALUES (%%s, %s)' % (
+                    FTS_TABLE, ', '.join(FIELDS), ', '.join(['%s'] * len(FIELDS))),
+                [listing_id] + [cjk.index_text(document.get(name)) for name in FIELDS])
+
+
+def update_listing(listing):
+    index_document(listing.pk, document_for(listing))
+
+
+def remove_listing(listing_id):
+    # the SearchDocument row goes with the listing (CASCADE), FTS5 rows do not
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM %s WHERE rowid = %%s' % FTS_TABLE, [listing_id])
+
+
+def rebuild():
+    from listings.models import Listing
+    count = 0
+    listings = Listing.objects.select_related('doctor').prefetch_related('services', 'professionals')
+    for listing in listings.iterator(chunk_size=200):
+        update_listing(listing)
+        count += 1
+    return count
+
+
+def terms(keywords):
+    # (token, prefix) pairs; CJK n-grams are whole terms, latin words may be typed partially
+    return [(token, not cjk.is_cjk(token)) for token in cjk.query_tokens(keywords)]
+
+
+def search(queryset, keywords):
+    """Filter a Listing queryset to keyword hits, best matches first."""
+    words = terms(keywords)
+    if not words:
+        return queryset
+    if is_postgres():
+        # prefix match on every term, like the old icontains did for partial words
+        query = SearchQuery(
+            ' & '.join("'%s'%s" % (word.replace("'", "''").replace('\\', ''), ':*' if prefix else '')
+                       for word, prefix in words),
+            config='simple', search_type='raw')
+        return (queryset.filter(search_document__vector=query)
+                .annotate(search_rank=Cast(SearchRank(F('search_document__vector'), query) * Value(float(RANK_SCALE)), IntegerField()))
+                .order_by('-search_rank', '-list_date', '-id'))
+    if connection.vendor == 'sqlite':
+        match = ' '.join('"%s"%s' % (word.replace('"', '""'), '*' if prefix else '') for word, prefix in words)
+        weights = ', '.join(str(weight) for _, weight in FIELDS.values())
+        # a join, so the FTS5 query runs once and each hit is looked up by primary key;
+        # Django cannot join a virtual table any other way
+        return (queryset.extra(
+                    select={'search_rank': 'CAST(-bm25(%s, %s) * %d AS INTEGER)' % (FTS_TABLE, weights, RANK_SCALE)},
+                    tables=[FTS_TABLE],
+                    where=['%s MATCH %%s' % FTS_TABLE, '%s.rowid = %s.id' % (FTS_TABLE, queryset.model._meta.db_table)],
+                    params=[match])
+                .order_by('-search_rank', '-list_date', '-id'))
+    keywords = keywords.strip()
+    return queryset.filter(Q(description__icontains=keywords) | Q(title__icontains=keywords) | Q(doctor__name__icontains=keywords))
@@ -0,0 +1,169 @@
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from taggit.models import Tag, TaggedItem
+
+from doctors.models import Doctor
+from listings import cache, cards, search
+from listings.bitmap import bitmap_index
+from listings.bm25 import rank_index
+from listings.postings import posting_index
+from listings.models import Listing, Subject
+
+
+def reindex(listings):
+    for listing in listings.select_related('doctor').prefetch_related('services', 'professionals'):
+        search.update_listing(listing)
+
+
+def related_changed(pks):
+    """Listings whose tags, subjects or their names changed without a Listing save."""
+    pks = list(pks)
+    cache.bump_listing_versions(pks)
+    Listing.objects.filter(pk__in=pks).update(updated_at=timezone.now())
+
+
+def update_document(listing):
+    document = search.document_for(listing)
+    search.index_document(listing.pk, document)
+    return document
+
+
+def data_changed(saved=None, deleted=None, relations=None, listing=None, document=None, structural=False):
+    """Bump the data version and patch this process's in-memory indexes once the transaction commits.
+
+    Until then other requests still read the old rows, so a bump any earlier
+    would let them cache old results, fragments and pages under the new
+    version (and a rollback would leave the patched indexes wrong).
+
+    ``relations`` is ``(kind, listing id, action, object ids)`` for the tags
+    or subjects of ``listing``; ``document`` is the listing's new search text
+    for the rank index. ``structural`` changes (renamed or deleted tags and
+    subjects, edits from the Subject side) leave the posting and rank indexes
+    to a lazy rebuild.
+    """
+    def apply():
+        version = cache.bump_version()
+        if saved is not None:
+            bitmap_index.update(saved, version)
+            posting_index.touch(version)
+            rank_index.update(saved, document, version)
+        elif deleted is not None:
+            bitmap_index.remove(deleted, version)
+            posting_index.remove(deleted, version)
+            rank_index.remove(deleted, version)
+        elif relations is not None:
+            bitmap_index.touch(version)  # tags and subjects live in the posting index only
+            posting_index.relations_changed(*relations, version=version)
+            rank_index.update(listing, document, version)
+        else:
+            bitmap_index.touch(version)
+            if not structural:
+                posting_index.touch(version)
+
+    transaction.on_commit(apply)
+
+
+def vocabulary_changed():
+    transaction.on_commit(lambda: cache.bump_version(cache.VOCABULARY_KEY))
+
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    cards.update_card(instance)
+    cache.bump_listing_versions([instance.pk])
+    data_changed(saved=instance, document=update_document(instance))
+
+
+@receiver(post_delete, sender=Listing)
+def listing_deleted(sender, instance, **kwargs):
+    search.remove_listing(instance.pk)
+    cache.count_deletion(Listing)
+    data_changed(deleted=instance.pk)
+
+
+def related_listings(instance):
+    """Ids of the listings linked to the tag or subject ``instance``."""
+    field = 'services' if isinstance(instance, Tag) else 'professionals'
+    return list(Listing.objects.filter(**{field: instance}).values_list('pk', flat=True))
+
+
+@receiver(m2m_changed, sender=Listing.professionals.through)
+@receiver(m2m_changed, sender=TaggedItem)
+def listing_relations_changed(sender, instance, action, pk_set=None, **kwargs):
+    if action == 'pre_clear' and not isinstance(instance, Listing):
+        # post_clear has no pk_set, the links are gone by then
+        instance._cleared_listings = related_listings(instance)
+        return
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if isinstance(instance, Listing):
+        kind = 'services' if sender is TaggedItem else 'professionals'
+        related_changed([instance.pk])
+        data_changed(relations=(kind, instance.pk, action, pk_set), listing=instance,
+                     document=update_document(instance))
+    else:
+        if action == 'post_clear':
+            pk_set = getattr(instance, '_cleared_listings', None)
+        if pk_set:
+            # changed from the Subject side, pk_set holds listing ids
+            reindex(Listing.objects.filter(pk__in=pk_set))
+            related_changed(pk_set)
+        data_changed(structural=True)
+
+
+@receiver(post_save, sender=Doctor)
+def doctor_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    reindex(Listing.objects.filter(doctor=instance))
+    cards.doctor_renamed(instance)
+    cache.bump_listing_versions(Listing.objects.filter(doctor=instance).values_list('pk', flat=True))
+    vocabulary_changed()
+    data_changed()
+
+
+@receiver(post_save, sender=Subject)
+def subject_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    reindex(Listing.objects.filter(professionals=instance))
+    related_changed(Listing.objects.filter(professionals=instance).values_list('pk', flat=True))
+    vocabulary_changed()
+    data_changed(structural=True)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    reindex(Listing.objects.filter(services=instance))
+    related_changed(Listing.objects.filter(services=instance).values_list('pk', flat=True))
+    vocabulary_changed()
+    data_changed(structural=True)
+
+
+@receiver(post_delete, sender=Doctor)
+def doctor_deleted(sender, instance, **kwargs):
+    cache.count_deletion(Doctor)
+    vocabulary_changed()
+    data_changed()
+
+
+@receiver(pre_delete, sender=Subject)
+@receiver(pre_delete, sender=Tag)
+def related_deleting(sender, instance, **kwargs):
+    # the listing links are gone by post_delete, and deleting them sends no m2m_changed
+    instance._deleted_listings = related_listings(instance)
+    related_changed(instance._deleted_listings)
+
+
+@receiver(post_delete, sender=Subject)
+@receiver(post_delete, sender=Tag)
+def related_deleted(sender, instance, **kwargs):
+    reindex(Listing.objects.filter(pk__in=getattr(instance, '_deleted_listings', ())))
+    vocabulary_changed()
+    data_changed(structural=True)
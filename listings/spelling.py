@@ -0,0 +1,137 @@
+"""Spelling correction for search keywords ("did you mean").
+
+A SymSpell index: every known term (district names, doctor names, service
+tags, subject names) is filed under each string reachable from it by
+deleting up to MAX_DISTANCE characters. A misspelt word is looked up through
+its own deletes, so finding candidates is a few dict hits instead of a scan
+of the vocabulary, and only those candidates get a real edit distance.
+
+Terms are compared without spaces or punctuation, so "Shatin" finds
+"Sha Tin". The index follows the vocabulary version, which only moves when a
+doctor, tag or subject is saved or deleted, not on every listing edit.
+"""
+import re
+import time
+from collections import defaultdict
+
+from listings import cache, cjk
+from listings.choices import district_choices
+
+MAX_DISTANCE = 2
+PREFIX_LENGTH = 7   # only the start of a term is expanded into deletes
+MAX_WORDS = 3       # longest run of keywords tried as a single term ("kwun tung")
+
+# on equal distance prefer the kinds users most often mistype
+KINDS = ('district', 'doctor', 'service', 'professional')
+
+TERM_CHARS = re.compile(r'[^\W_]+')
+
+
+def compact(text):
+    return ''.join(TERM_CHARS.findall(cjk.fold(text)))
+
+
+def allowed_distance(key):
+    if len(key) < 3:
+        return 0
+    return 1 if len(key) <= 4 else MAX_DISTANCE
+
+
+def deletes(key, distance):
+    result = frontier = {key}
+    for _ in range(distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))} - result
+        result = result | frontier
+    return result
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance, or ``limit + 1`` once it is exceeded."""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = a[i - 1] != b[j - 1]
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+class SpellingIndex(cache.VersionedIndex):
+    version_key = cache.VOCABULARY_KEY
+
+    def __init__(self):
+        super().__init__()
+        self.terms = {}                     # compact key -> (display text, kind)
+        self.deletes = {}                   # delete of a key prefix -> [keys]
+        self.rebuild_seconds = None
+
+    def load(self, version):
+        from taggit.models import Tag
+        from doctors.models import Doctor
+        from listings.models import Subject
+
+        started = time.perf_counter()
+        sources = (
+            ('district', district_choices),
+            ('doctor', Doctor.objects.values_list('name', flat=True)),
+            ('service', Tag.objects.values_list('name', flat=True)),
+            ('professional', Subject.objects.values_list('name', flat=True)),
+        )
+        terms, index = {}, defaultdict(list)
+        for kind, names in sources:
+            for text in names:
+                key = compact(text)
+                if not key or key in terms:
+                    continue
+                terms[key] = (text, kind)
+                for delete in deletes(key[:PREFIX_LENGTH], allowed_distance(key)):
+                    index[delete].append(key)
+        self.terms, self.deletes = terms, dict(index)
+        self.version = version
+        self.rebuild_seconds = time.perf_counter() - started
+
+    def lookup(self, text):
+        """``(term, kind, distance)`` of the closest known term, or None."""
+        key = compact(text)
+        if key in self.terms:
+            return self.terms[key] + (0,)
+        limit = allowed_distance(key)
+        if not limit:
+            return None
+        best, best_rank = None, None
+        candidates = {candidate for delete in deletes(key[:PREFIX_LENGTH], limit)
+                      for candidate in self.deletes.get(delete, ())}
+        for candidate in candidates:
+            distance = edit_distance(key, candidate, min(limit, allowed_distance(candidate)))
+            if distance > limit or distance > allowed_distance(candidate):
+                continue
+            term, kind = self.terms[candidate]
+            rank = (distance, KINDS.index(kind), candidate)
+            if best_rank is None or rank < best_rank:
+                best, best_rank = (term, kind, distance), rank
+        return best
+
+    def correct(self, keywords):
+        """``[(words, term, kind, distance)]`` for the runs of ``keywords`` that name a known term."""
+        words, corrections, i = keywords.split(), [], 0
+        while i < len(words):
+            for size in range(min(MAX_WORDS, len(words) - i), 0, -1):
+                span = ' '.join(words[i:i + size])
+                match = self.lookup(span)
+                if match is not None:
+                    corrections.append((span,) + match)
+                    i += size
+                    break
+            else:
+                i += 1
+        return corrections
+
+
+spelling_index = SpellingIndex()
@@ -0,0 +1,131 @@
+"""Prefix index behind the search box typeahead.
+
+Listing titles, doctor names, service tags and subject names are folded
+(listings.cjk.fold, so 診所 and 诊所 match) and inserted into a character
+trie. Every word start is a key, and because Chinese has no spaces every
+character of a CJK run starts a key as well, so 大明 finds 陳大明醫生.
+
+Each trie node keeps its best ``TOP_K`` entries once they have been asked
+for, so a repeated prefix is a walk down the trie and a slice. The trie is
+rebuilt from the database only when the shared data version moves.
+"""
+import re
+import time
+
+from listings import cache, cjk
+
+TOP_K = 10           # most suggestions ever returned, also the per-prefix cache size
+MAX_KEY = 24         # characters of a key kept in the trie
+MAX_QUERY = 50
+
+# listing titles first, then people, then the tag-like names
+KIND_WEIGHTS = {'listing': 3, 'doctor': 2, 'service': 1, 'professional': 1}
+
+WORD_START = re.compile(r'(?<![^\W_])[^\W_]')
+
+
+def normalize(text):
+    return ' '.join(cjk.fold(text).split())
+
+
+def key_starts(key):
+    """Offsets in ``key`` a prefix search may start from."""
+    starts = {0}
+    starts.update(match.start() for match in WORD_START.finditer(key))
+    for run in cjk.CJK_RUN.finditer(key):
+        starts.update(range(run.start(), run.end()))
+    return sorted(starts)
+
+
+class Node:
+    __slots__ = ('children', 'entries', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.entries = {}   # entry id -> rank of the key ending here
+        self.top = None
+
+
+class SuggestIndex(cache.VersionedIndex):
+    def __init__(self):
+        super().__init__()
+        self.root = Node()
+        self.entries = []    # entry id -> (text, kind)
+        self.rebuild_seconds = None
+
+    def load(self, version):
+        from taggit.models import Tag
+        from doctors.models import Doctor
+        from listings.models import Listing, Subject
+
+        started = time.perf_counter()
+        sources = (
+            ('listing', Listing.objects.filter(is_published=True).values_list('title', flat=True)),
+            ('doctor', Doctor.objects.values_list('name', flat=True)),
+            ('service', Tag.objects.values_list('name', flat=True)),
+            ('professional', Subject.objects.values_list('name', flat=True)),
+        )
+        root, entries, seen = Node(), [], set()
+        for kind, names in sources:
+            for text in names.iterator():
+                text = ' '.join((text or '').split())
+                if not text or (kind, text.lower()) in seen:
+                    continue
+                seen.add((kind, text.lower()))
+                entries.append((text, kind))
+                self._insert(root, len(entries) - 1, text, kind)
+        self.root, self.entries = root, entries
+        self.version = version
+        self.rebuild_seconds = time.perf_counter() - started
+
+    @staticmethod
+    def _insert(root, entry_id, text, kind):
+        key = normalize(text)
+        for start in key_starts(key):
+            node = root
+            for char in key[start:start + MAX_KEY]:
+                node = node.children.setdefault(char, Node())
+            # whole-text prefixes before mid-text ones, heavier kinds, then shorter text
+            rank = (start > 0, -KIND_WEIGHTS[kind], len(text), key)
+            if entry_id not in node.entries or rank < node.entries[entry_id]:
+                node.entries[entry_id] = rank
+
+    def _top(self, node):
+        if node.top is None:
+            best = {}
+            stack = [node]
+            while stack:
+                current = stack.pop()
+                for entry_id, rank in current.entries.items():
+                    if entry_id not in best or rank < best[entry_id]:
+                        best[entry_id] = rank
+                stack.extend(current.children.values())
+            node.top = sorted(best, key=best.__getitem__)[:TOP_K]
+        return node.top
+
+    def suggest(self, query, limit=TOP_K):
+        """Up to ``limit`` ``{'text', 'kind'}`` dicts whose words start with ``query``."""
+        key = normalize(query[:MAX_QUERY])[:MAX_KEY]
+        if not key:
+            return []
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        with self.lock:
+            top = self._top(node)
+        return [{'text': self.entries[entry_id][0], 'kind': self.entries[entry_id][1]}
+                for entry_id in top[:min(limit, TOP_K)]]
+
+    def stats(self):
+        nodes, stack = 0, [self.root]
+        while stack:
+            node = stack.pop()
+            nodes += 1
+            stack.extend(node.children.values())
+        return {'version': self.version, 'entries': len(self.entries), 'nodes': nodes,
+                'rebuild_seconds': self.rebuild_seconds}
+
+
+suggest_index = SuggestIndex()
@@ -1,3 +1,660 @@
-from django.test import TestCase
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import DatabaseError, connection, transaction
+from django.db.models.functions import Lower
+from django.test import SimpleTestCase, TestCase, override_settings
+from taggit.models import Tag
+
+from config import testing
+from doctors.models import Doctor
+from listings import cjk, search, views
+from listings.bitmap import ATTRIBUTES, BitmapIndex, bitmap_index
+from listings.bm25 import Corpus, RankIndex, rank_index
+from listings.cache import VOCABULARY_KEY, data_version, listing_version
+from listings.facets import search_facets
+from listings.models import Listing, ListingCard, Subject
+from listings.paginator import IdListPaginator, KeysetPaginator, encode_cursor
+from listings.postings import PostingIndex, intersect, merge, posting_index
+from listings.spelling import allowed_distance, compact, deletes, edit_distance, spelling_index
+from listings.suggest import TOP_K, suggest_index
+
+
+def create_listing(doctor, title, **fields):
+    fields = {'address': '1 Road', 'district': 'Wan Chai', 'room_type': 'Private Rooms', 'service': 1, 'screen': 1,
+              'professional': 1, 'rooms': '2', 'photo_main': 'photos/clinic.png', 'is_published': True, **fields}
+    return Listing.objects.create(doctor=doctor, title=title, **fields)
+
+
+@override_settings(CACHES=testing.CACHES)
+class ListingIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='Dr Chan', email='chan@example.com', photo='doctors/chan.png')
+        districts = ['Sha Tin', 'Wan Chai', 'Kwun Tong']
+        room_types = ['Private Rooms', 'Semi-Private Rooms', 'Standard (Multi-bed) Rooms']
+        for i in range(60):
+            Listing.objects.create(
+                doctor=doctor, title='Clinic %d' % i, address='Road %d' % i,
+                district=districts[i % 3], room_type=room_types[i % 3],
+                service=1, screen=1, professional=1, rooms=str(i % 10 + 1),
+                photo_main='photos/clinic.png', is_published=i % 4 != 0)
+
+    def setUp(self):
+        # a cold (test) cache for every test
+        cache.clear()
+
+    def plan(self, queryset):
+        if connection.vendor == 'postgresql':
+            # a test-sized table is always cheaper to seq scan
+            with connection.cursor() as cursor:
+                cursor.execute('SET LOCAL enable_seqscan = off')
+        return queryset.explain()
+
+    def test_published_listings_use_partial_index(self):
+        queryset = Listing.objects.filter(is_published=True).order_by('-list_date', '-id')[:3]
+        self.assertIn('listing_published_date_idx', self.plan(queryset))
+
+    def test_district_search_uses_lower_index(self):
+        queryset = (Listing.objects.filter(is_published=True)
+                    .alias(district_key=Lower('district')).filter(district_key='sha tin')
+                    .order_by('-list_date', '-id'))
+        self.assertIn('listing_district_type_idx', self.plan(queryset))
+
+    def test_room_type_search_uses_lower_index(self):
+        queryset = (Listing.objects.filter(is_published=True)
+                    .alias(room_type_key=Lower('room_type')).filter(room_type_key='private rooms')
+                    .order_by('-list_date', '-id'))
+        self.assertIn('listing_room_type_idx', self.plan(queryset))
+
+    def test_search_view_is_case_insensitive(self):
+        response = self.client.get('/listings/search', {'district': 'SHA TIN', 'room_type': 'private rooms'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['listings']), 3)
+        self.assertTrue(all(listing.district == 'Sha Tin' for listing in response.context['listings']))
+
+    def test_each_facet_is_counted_under_the_other_filters(self):
+        facets = search_facets({'district': 'sha tin'})  # normalized, as the view passes it
+        districts = {key: count for key, _, count in facets['district']}
+        self.assertEqual([districts[key] for key in ('Sha Tin', 'Wan Chai', 'Kwun Tong')], [15, 15, 15])
+        self.assertEqual({key: count for key, _, count in facets['room_type']},
+                         {'Private Rooms': 15, 'Semi-Private Rooms': 0, 'Standard (Multi-bed) Rooms': 0})
+        self.assertEqual(dict((key, count) for key, _, count in facets['rooms'])['10'], 2)
+
+    def test_patched_bitmap_index_matches_a_rebuild(self):
+        index = bitmap_index.current()
+        listing = Listing.objects.filter(district='Sha Tin', is_published=True).first()
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.district, listing.rooms = 'Wan Chai', '10'
+            listing.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.filter(district='Kwun Tong').first().delete()
+        self.assertEqual(index.version, data_version())  # patched twice, not reloaded
+        fresh = BitmapIndex()
+        fresh.load(index.version)
+        for name in ATTRIBUTES:
+            self.assertEqual({value: set(bitmap) for value, bitmap in index.bitmaps[name].items() if bitmap},
+                             {value: set(bitmap) for value, bitmap in fresh.bitmaps[name].items()})
+        self.assertEqual(index.sort_keys, fresh.sort_keys)
+        self.assertIn(listing.pk, index.matching({'district': 'wan chai', 'rooms': '9'}))
+
+    def test_patches_never_change_what_a_reader_holds(self):
+        index = bitmap_index.current()
+        sha_tin, everything = index.get('district', 'sha tin'), index.matching({})
+        held = (set(sha_tin), set(everything), dict(index.bitmaps['district']))
+        listing = Listing.objects.filter(district='Sha Tin', is_published=True).first()
+        pk = listing.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.district = 'Wan Chai'
+            listing.save()
+        self.assertNotIn(pk, index.get('district', 'sha tin'))
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.delete()
+        self.assertEqual((set(sha_tin), set(everything)), held[:2])
+        self.assertIs(held[2]['sha tin'], sha_tin)  # the dict a facet count iterates is not mutated either
+        self.assertEqual(index.ordered(everything)[-1], pk)  # deleted since: sorts last, no KeyError
+
+    def test_rooms_filter_is_numeric(self):
+        Listing.objects.filter(rooms='1').update(rooms='10')
+        for listing in Listing.objects.filter(rooms='10'):
+            listing.save()
+        counts = set(Listing.objects.filter(room_count__gte=2).values_list('rooms', flat=True))
+        self.assertIn('10', counts)
+        self.assertNotIn('1', counts)
+
+    def test_non_decimal_rooms_value_is_ignored(self):
+        response = self.client.get('/listings/search', {'rooms': '²'})  # str.isdigit() accepts superscripts
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['listings'].estimated_total, 45)
+
+    def test_rooms_range_uses_room_count_index(self):
+        queryset = Listing.objects.filter(is_published=True, room_count__gte=8).order_by().values('id')
+        self.assertIn('listing_room_count_idx', self.plan(queryset))
+
+
+@override_settings(CACHES=testing.CACHES)
+class ListingCardTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(name='Dr Chan', email='chan@example.com', photo='doctors/chan.png')
+        cls.listing = create_listing(cls.doctor, 'Harbour Clinic')
+
+    def setUp(self):
+        cache.clear()
+
+    def card(self):
+        return ListingCard.objects.get(pk=self.listing.pk)
+
+    def test_card_copies_the_listing(self):
+        card = self.card()
+        self.assertEqual((card.title, card.district, card.rooms, card.doctor_name, card.is_published),
+                         ('Harbour Clinic', 'Wan Chai', '2', 'Dr Chan', True))
+        self.assertEqual((card.photo_main_url, card.list_date), (self.listing.photo_main.url, self.listing.list_date))
+
+    def test_card_follows_listing_saves(self):
+        self.listing.title, self.listing.district, self.listing.photo_main = 'Harbour Dental', 'Sha Tin', 'photos/dental.png'
+        self.listing.save()
+        card = self.card()
+        self.assertEqual((card.title, card.district), ('Harbour Dental', 'Sha Tin'))
+        self.assertTrue(card.photo_main_url.endswith('/photos/dental.png'))
+        self.listing.photo_main = ''
+        self.listing.save()
+        self.assertEqual(self.card().photo_main_url, '')
+
+    def test_unpublished_listing_leaves_the_card_pages(self):
+        self.assertContains(self.client.get('/listings/'), 'Harbour Clinic')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.is_published = False
+            self.listing.save()
+        self.assertFalse(self.card().is_published)
+        self.assertNotContains(self.client.get('/listings/'), 'Harbour Clinic')
+
+    def test_card_follows_doctor_renames(self):
+        other = create_listing(Doctor.objects.create(name='Dr Ho', email='ho@example.com', photo='doctors/ho.png'), 'Eye Centre')
+        self.doctor.name = 'Dr Chan Tai Man'
+        self.doctor.save()
+        self.assertEqual(self.card().doctor_name, 'Dr Chan Tai Man')
+        self.assertEqual(ListingCard.objects.get(pk=other.pk).doctor_name, 'Dr Ho')
+
+    def test_card_goes_with_its_listing(self):
+        self.listing.delete()
+        self.assertFalse(ListingCard.objects.exists())
+
+
+@override_settings(CACHES=testing.CACHES)
+class DataVersionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(name='Dr Lee', email='lee@example.com', photo='doctors/lee.png')
+        cls.listing = Listing.objects.create(
+            doctor=cls.doctor, title='Harbour Clinic', address='1 Road', district='Wan Chai',
+            room_type='Private Rooms', service=1, screen=1, professional=1, rooms='2',
+            photo_main='photos/clinic.png', is_published=True)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_version_moves_when_the_save_commits(self):
+        before = data_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.listing.title = 'Harbour Day Clinic'
+            self.listing.save()
+            self.assertEqual(data_version(), before)
+        for callback in callbacks:
+            callback()
+        self.assertGreater(data_version(), before)
+
+    def test_rolled_back_save_keeps_the_version_and_indexes(self):
+        version = bitmap_index.current().version
+        with self.captureOnCommitCallbacks() as callbacks:
+            try:
+                with transaction.atomic():
+                    self.listing.district = 'Sha Tin'
+                    self.listing.save()
+                    raise DatabaseError
+            except DatabaseError:
+                pass
+        self.assertEqual(callbacks, [])
+        self.assertEqual(data_version(), version)
+        self.assertIn(self.listing.pk, bitmap_index.current().get('district', 'wan chai'))
+
+    def test_listing_version_moves_when_the_save_commits(self):
+        before = listing_version(self.listing.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listing.save()
+            self.assertEqual(listing_version(self.listing.pk), before)
+        self.assertGreater(listing_version(self.listing.pk), before)
+
+
+class PostingListTests(SimpleTestCase):
+    def test_intersect(self):
+        self.assertEqual(intersect([[1, 3, 5, 7, 9], [3, 4, 5, 9, 12], [0, 5, 9]]), [5, 9])
+        self.assertEqual(intersect([[1, 2], [3, 4]]), [])
+        self.assertEqual(intersect([[], [1, 2]]), [])
+        self.assertEqual(intersect([[2, 4]]), [2, 4])
+        self.assertEqual(intersect([]), [])
+
+    def test_merge(self):
+        self.assertEqual(merge([[1, 5], [2, 5, 8]]), [1, 2, 5, 8])
+        self.assertEqual(merge([[3, 4]]), [3, 4])
+
+
+@override_settings(CACHES=testing.CACHES)
+class PostingIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='Dr Wong', email='wong@example.com', photo='doctors/wong.png')
+        cls.listings = [create_listing(doctor, 'Clinic %d' % i) for i in range(4)]
+        cls.surgery, cls.nursing = Subject.objects.create(name='Surgery'), Subject.objects.create(name='Nursing')
+        for listing in cls.listings[:3]:
+            listing.services.add('Vaccine')
+        cls.listings[1].services.add('Paediatrics')
+        cls.listings[2].services.add('Paediatrics')
+        cls.listings[2].professionals.add(cls.surgery)
+        cls.listings[3].professionals.add(cls.nursing)
+
+    def setUp(self):
+        cache.clear()
+
+    def pks(self, *indexes):
+        return sorted(self.listings[i].pk for i in indexes)
+
+    def test_lookup_intersects_every_name_case_insensitively(self):
+        index = posting_index.current()
+        self.assertEqual(index.lookup('services', ['vaccine']), self.pks(0, 1, 2))
+        self.assertEqual(index.lookup('services', ['VACCINE', 'paediatrics']), self.pks(1, 2))
+        self.assertEqual(index.lookup('services', ['vaccine', 'unknown']), [])
+        self.assertEqual(index.lookup('professionals', ['surgery']), self.pks(2))
+        self.assertEqual(index.choices('services'), ['Paediatrics', 'Vaccine'])
+
+    def assertMatchesRebuild(self, index):
+        self.assertEqual(index.version, data_version())  # patched, not reloaded
+        fresh = PostingIndex()
+        fresh.load(index.version)
+        for kind in ('services', 'professionals'):
+            self.assertEqual({key: list(posting) for key, posting in index.postings[kind].items() if posting},
+                             {key: list(posting) for key, posting in fresh.postings[kind].items()})
+
+    def test_relation_changes_patch_the_index(self):
+        index = posting_index.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[3].services.add('Vaccine')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[0].services.remove('Vaccine')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[2].professionals.clear()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[1].professionals.add(self.nursing)
+        self.assertMatchesRebuild(index)
+        self.assertEqual(index.lookup('services', ['vaccine']), self.pks(1, 2, 3))
+        self.assertEqual(index.lookup('professionals', ['nursing']), self.pks(1, 3))
+
+    def test_deleted_listing_is_patched_out(self):
+        index = posting_index.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[2].delete()
+        self.assertMatchesRebuild(index)
+        self.assertEqual(index.lookup('services', ['paediatrics']), self.pks(1))
+
+    def test_new_tag_rebuilds_on_next_read(self):
+        index = posting_index.current()
+        version = index.version
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[0].services.add('Physiotherapy')
+        self.assertEqual(index.version, version)  # its name is unknown to the patch
+        self.assertEqual(posting_index.current().lookup('services', ['physiotherapy']), self.pks(0))
+
+
+@override_settings(CACHES=testing.CACHES)
+class SuggestTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='陳大明醫生', email='chan@example.com', photo='doctors/chan.png')
+        Doctor.objects.create(name='Harriet Lam', email='lam@example.com', photo='doctors/lam.png')
+        create_listing(doctor, 'Harbour Clinic').services.add('Hearing Test')
+        create_listing(doctor, '中環診所')
+        create_listing(doctor, 'Happy Valley Clinic', is_published=False)
+        Subject.objects.create(name='Haematology')
+
+    def setUp(self):
+        cache.clear()
+
+    def texts(self, query, limit=TOP_K):
+        return [entry['text'] for entry in suggest_index.current().suggest(query, limit)]
+
+    def test_word_starts_match(self):
+        self.assertEqual(self.texts('clin'), ['Harbour Clinic'])
+        self.assertEqual(self.texts('hearing t'), ['Hearing Test'])
+        self.assertEqual(self.texts('x'), [])
+        self.assertEqual(self.texts('  '), [])
+
+    def test_ranking_prefers_listings_then_people_then_names(self):
+        self.assertEqual(self.texts('h'), ['Harbour Clinic', 'Harriet Lam', 'Haematology', 'Hearing Test'])
+        self.assertEqual(self.texts('h', limit=2), ['Harbour Clinic', 'Harriet Lam'])
+        self.assertEqual(suggest_index.current().suggest('harb')[0], {'text': 'Harbour Clinic', 'kind': 'listing'})
+
+    def test_unpublished_listings_are_not_suggested(self):
+        self.assertEqual(self.texts('happy'), [])
+
+    def test_cjk_matches_inside_a_run_and_across_variants(self):
+        self.assertEqual(self.texts('大明'), ['陳大明醫生'])
+        self.assertEqual(self.texts('诊所'), ['中環診所'])
+        self.assertEqual(self.texts('中环'), ['中環診所'])
+
+    def test_rebuilt_when_the_data_version_moves(self):
+        index = suggest_index.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            create_listing(Doctor.objects.first(), 'Harmony Dental')
+        self.assertNotEqual(index.version, data_version())
+        self.assertIn('Harmony Dental', self.texts('harm'))
+
+    def test_view_ignores_a_non_decimal_limit(self):
+        for limit in ('2', '²', 'x'):
+            with self.subTest(limit=limit):
+                response = self.client.get('/listings/suggest', {'q': 'h', 'limit': limit})
+                self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(self.client.get('/listings/suggest', {'q': 'h', 'limit': '2'}).json()['suggestions']), 2)
+
+
+def document(title='', doctor='', services='', professionals='', description=''):
+    return {'title': title, 'doctor': doctor, 'services': services, 'professionals': professionals,
+            'description': description}
+
+
+class CorpusTests(SimpleTestCase):
+    def setUp(self):
+        self.corpus = Corpus()
+        self.corpus.add(1, document(title='Dental Clinic', description='Check ups'))
+        self.corpus.add(2, document(title='Family Clinic', description='Dental care and vaccines'))
+        self.corpus.add(3, document(title='Harbour Dental and Orthodontic Centre for Families', services='Vaccine'))
+        self.corpus.add(4, document(title='牙科診所', doctor='Dr Chan'))
+
+    def ranked(self, keywords):
+        scores = self.corpus.scores(keywords)
+        return sorted(scores, key=scores.get, reverse=True)
+
+    def test_title_outweighs_description_and_short_fields_outweigh_long(self):
+        self.assertEqual(self.ranked('dental'), [1, 3, 2])
+
+    def test_every_word_must_match(self):
+        self.assertEqual(self.ranked('dental vaccine'), [3, 2])
+        self.assertEqual(self.ranked('dental nothing'), [])
+
+    def test_latin_words_match_as_prefixes_cjk_as_ngrams(self):
+        self.assertEqual(sorted(self.corpus.scores('dent')), [1, 2, 3])
+        self.assertEqual(self.ranked('牙科'), [4])
+        self.assertEqual(self.ranked('牙科 chan'), [4])
+
+    def test_rare_terms_score_higher(self):
+        scores = self.corpus.scores('orthodontic') | self.corpus.scores('clinic')
+        self.assertGreater(scores[3], scores[1])
+
+    def test_removed_documents_stop_matching_and_compaction_keeps_scores(self):
+        self.corpus.remove(1)
+        before = self.corpus.scores('dental')
+        self.assertEqual(sorted(before), [2, 3])
+        compacted = self.corpus.compacted()
+        self.assertEqual(list(compacted.ids), [2, 3, 4])
+        after = compacted.scores('dental')
+        self.assertEqual(before.keys(), after.keys())
+        for pk in before:
+            self.assertAlmostEqual(before[pk], after[pk])
+
+    def test_compaction_waits_for_a_quarter_of_dead_slots(self):
+        corpus = Corpus()
+        for pk in range(500):
+            corpus.add(pk, document(title='Clinic %d' % pk))
+        for pk in range(101):
+            corpus.remove(pk)
+        self.assertFalse(corpus.needs_compaction())
+        for pk in range(101, 126):
+            corpus.remove(pk)
+        self.assertTrue(corpus.needs_compaction())
+
+
+@override_settings(CACHES=testing.CACHES)
+class RankIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='Dr Ng', email='ng@example.com', photo='doctors/ng.png')
+        cls.listings = [create_listing(doctor, 'Clinic %d' % i, description='dental' if i % 2 else '') for i in range(6)]
+        create_listing(doctor, 'Dental Draft', is_published=False)
+
+    def setUp(self):
+        cache.clear()
+
+    def test_top_orders_and_limits_the_allowed_matches(self):
+        index = rank_index.current()
+        pks = [listing.pk for listing in self.listings]
+        ids, total = index.top('dental')
+        self.assertEqual((ids, total), ([pks[5], pks[3], pks[1]], 3))  # equal scores: newest first
+        self.assertEqual(index.top('dental', allowed={pks[1], pks[3]}, limit=1), ([pks[3]], 2))
+        self.assertEqual(index.matches('dental'), [pks[1], pks[3], pks[5]])
+
+    def test_saves_and_deletes_patch_the_index(self):
+        index = rank_index.current()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[0].title = 'Dental Centre'
+            self.listings[0].save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[1].is_published = False
+            self.listings[1].save()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.listings[3].delete()
+        self.assertEqual(index.version, data_version())  # patched, not reloaded
+        fresh = RankIndex()
+        fresh.load(index.version)
+        patched, rebuilt = index.corpus.scores('dental'), fresh.corpus.scores('dental')
+        self.assertEqual(sorted(patched), sorted([self.listings[0].pk, self.listings[5].pk]))
+        self.assertEqual(patched.keys(), rebuilt.keys())
+        for pk in patched:
+            self.assertAlmostEqual(patched[pk], rebuilt[pk])
+
+    def test_relevance_pages_are_heap_selected(self):
+        doctor = Doctor.objects.get()
+        for i in range(6, 12):
+            create_listing(doctor, 'Clinic %d' % i)
+        ranked = rank_index.current().top('clinic')[0]
+        seen, params = [], {'keywords': 'clinic', 'sort': 'relevance'}
+        with mock.patch.object(views, 'RANK_WINDOW', 5), \
+                mock.patch.object(RankIndex, 'top', autospec=True, side_effect=RankIndex.top) as top:
+            while True:
+                page = self.client.get('/listings/search', params).context['listings']
+                seen += [card.pk for card in page]
+                self.assertEqual(page.estimated_total, 12)
+                if not page.has_next:
+                    break
+                params['cursor'] = page.next_cursor
+        self.assertEqual(seen, ranked)
+        self.assertEqual([call.args[3] for call in top.call_args_list], [5, 10, 20])  # the third page reuses the 10
+
+
+class EditDistanceTests(SimpleTestCase):
+    def test_edit_distance(self):
+        self.assertEqual(edit_distance('kwuntung', 'kwuntong', 2), 1)
+        self.assertEqual(edit_distance('shtain', 'shatin', 2), 1)  # a transposition is one edit
+        self.assertEqual(edit_distance('kitten', 'sitting', 3), 3)
+        self.assertEqual(edit_distance('kitten', 'sitting', 2), 3)  # stops past the limit
+        self.assertEqual(edit_distance('ab', 'abcdef', 2), 3)
+        self.assertEqual(edit_distance('same', 'same', 0), 0)
+
+    def test_allowed_distance_grows_with_length(self):
+        self.assertEqual([allowed_distance(key) for key in ('ab', 'abc', 'abcd', 'abcde')], [0, 1, 1, 2])
+
+    def test_deletes_and_compact_keys(self):
+        self.assertEqual(deletes('abc', 1), {'abc', 'bc', 'ac', 'ab'})
+        self.assertEqual(len(deletes('abcd', 2)), 1 + 4 + 6)
+        self.assertEqual(compact('Sha Tin'), 'shatin')
+        self.assertEqual(compact('Kwun-Tong!'), 'kwuntong')
+
+
+@override_settings(CACHES=testing.CACHES)
+class SpellingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctor = Doctor.objects.create(name='Dr Cheung', email='cheung@example.com', photo='doctors/cheung.png')
+        create_listing(cls.doctor, 'Clinic').services.add('Physiotherapy')
+
+    def setUp(self):
+        cache.clear()
+
+    def test_lookup(self):
+        index = spelling_index.current()
+        self.assertEqual(index.lookup('Sha Tin'), ('Sha Tin', 'district', 0))
+        self.assertEqual(index.lookup('shatin'), ('Sha Tin', 'district', 0))
+        self.assertEqual(index.lookup('kwun tung'), ('Kwun Tong', 'district', 1))
+        self.assertEqual(index.lookup('physiotheraphy'), ('Physiotherapy', 'service', 1))
+        self.assertEqual(index.lookup('Dr Chueng'), ('Dr Cheung', 'doctor', 1))
+        self.assertIsNone(index.lookup('xyz'))
+        self.assertIsNone(index.lookup('wa'))  # too short to correct
+
+    def test_correct_finds_multi_word_runs(self):
+        corrections = spelling_index.current().correct('dentist kwun tung physio theraphy')
+        self.assertEqual(corrections, [('kwun tung', 'Kwun Tong', 'district', 1),
+                                       ('physio theraphy', 'Physiotherapy', 'service', 1)])
+
+    def test_follows_the_vocabulary_version_only(self):
+        index = spelling_index.current()
+        version = index.version
+        with self.captureOnCommitCallbacks(execute=True):
+            create_listing(self.doctor, 'Another Clinic')
+        self.assertEqual(data_version(VOCABULARY_KEY), version)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.doctor.name = 'Dr Cheung Wai'
+            self.doctor.save()
+        self.assertNotEqual(data_version(VOCABULARY_KEY), version)
+        self.assertEqual(spelling_index.current().lookup('dr cheung wia')[:2], ('Dr Cheung Wai', 'doctor'))
+
+
+class TokenizerTests(SimpleTestCase):
+    def test_fold_merges_variants_widths_and_case(self):
+        self.assertEqual(cjk.fold('醫生'), cjk.fold('医生'))
+        self.assertEqual(cjk.fold('ＡＢＣ Clinic'), 'abc clinic')
+        self.assertEqual(cjk.fold(None), '')
+
+    def test_index_tokens_cut_cjk_runs_into_ngrams(self):
+        self.assertEqual(cjk.index_tokens('Dr陳 Clinic 安心診所'),
+                         ['dr', '陈', 'clinic', '安', '心', '诊', '所', '安心', '心诊', '诊所', '安心诊', '心诊所'])
+        self.assertEqual(cjk.index_tokens('Room 3-B'), ['room', '3', 'b'])
+
+    def test_query_tokens_use_the_longest_indexed_ngrams(self):
+        self.assertEqual(cjk.query_tokens('安心診所 安心'), ['安心诊', '心诊所', '安心'])
+        self.assertEqual(cjk.query_tokens('診'), ['诊'])
+        self.assertEqual(cjk.query_tokens('clinic CLINIC'), ['clinic'])
+        self.assertTrue(set(cjk.query_tokens('安心診所')) <= set(cjk.index_tokens('中環安心診所')))
+
+    def test_terms_mark_latin_words_as_prefixes(self):
+        self.assertEqual(search.terms('clin 診所'), [('clin', True), ('诊所', False)])
+
+
+@override_settings(CACHES=testing.CACHES)
+class FullTextSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='陳大明', email='chan@example.com', photo='doctors/chan.png')
+        cls.title = create_listing(doctor, '安心診所 Dental')
+        cls.description = create_listing(doctor, 'Harbour Clinic', description='牙科 安心诊所 dental care')
+        cls.other = create_listing(doctor, 'Eye Centre')
+        for listing in (cls.title, cls.description, cls.other):
+            search.update_listing(listing)
+
+    def titles(self, keywords):
+        return list(search.search(Listing.objects.all(), keywords).values_list('title', flat=True))
+
+    def test_title_hits_rank_first_in_either_script(self):
+        self.assertEqual(self.titles('安心診所'), ['安心診所 Dental', 'Harbour Clinic'])
+        self.assertEqual(self.titles('安心诊所'), ['安心診所 Dental', 'Harbour Clinic'])
+        self.assertEqual(self.titles('dent'), ['安心診所 Dental', 'Harbour Clinic'])
+
+    def test_every_term_must_match(self):
+        self.assertEqual(self.titles('牙科 dental'), ['Harbour Clinic'])
+        self.assertEqual(self.titles('陳大明 eye'), ['Eye Centre'])
+        self.assertEqual(self.titles('安心 nothing'), [])
+
+    def test_removed_listing_stops_matching(self):
+        search.remove_listing(self.title.pk)
+        self.assertEqual(self.titles('安心診所'), ['Harbour Clinic'])
+
+    def test_deleted_or_cleared_relations_stop_matching(self):
+        # deleting a tag or subject removes the links without an m2m_changed per listing
+        self.other.services.add('Vaccination')
+        subject = Subject.objects.create(name='Ophthalmology')
+        self.other.professionals.add(subject)
+        self.assertEqual(self.titles('vaccination ophthalmology'), ['Eye Centre'])
+
+        Tag.objects.get(name='Vaccination').delete()
+        self.assertEqual(self.titles('vaccination'), [])
+        self.assertEqual(self.titles('ophthalmology'), ['Eye Centre'])
+        subject.listing_set.clear()
+        self.assertEqual(self.titles('ophthalmology'), [])
+
+        subject = Subject.objects.create(name='Optometry')
+        self.other.professionals.add(subject)
+        self.assertEqual(self.titles('optometry'), ['Eye Centre'])
+        subject.delete()
+        self.assertEqual(self.titles('optometry'), [])
+
+
+@override_settings(CACHES=testing.CACHES)
+class PaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='Dr Chan', email='chan@example.com', photo='doctors/chan.png')
+        for i in range(7):
+            create_listing(doctor, 'Clinic %d' % i, is_published=i < 6)
+        cls.cards = ListingCard.objects.filter(is_published=True).order_by('-list_date')
+
+    def setUp(self):
+        cache.clear()
+
+    def titles(self, page):
+        return [card.title for card in page]
+
+    def test_keyset_pages_cover_every_row_once(self):
+        paginator = KeysetPaginator(self.cards, 4, keys=('-list_date', '-pk'))
+        first = paginator.get_page()
+        self.assertEqual((first.has_previous, first.has_next), (False, True))
+        second = paginator.get_page(first.next_cursor)
+        self.assertEqual((second.has_previous, second.has_next), (True, False))
+        expected = list(self.cards.order_by('-list_date', '-pk').values_list('title', flat=True))
+        self.assertEqual(self.titles(first) + self.titles(second), expected)
+        self.assertEqual(self.titles(paginator.get_page(second.previous_cursor)), self.titles(first))
+
+    def test_tampered_cursor_falls_back_to_the_first_page(self):
+        paginator = KeysetPaginator(self.cards, 4, keys=('-list_date', '-pk'))
+        first = self.titles(paginator.get_page())
+        for cursor in ('garbage', encode_cursor(['yesterday', 1], 'n'), encode_cursor([{'dt': '2024-13-45'}, 1], 'n'),
+                       encode_cursor([[1], 'x'], 'n'), encode_cursor([1], 'n'), encode_cursor([1, 2], 'sideways')):
+            with self.subTest(cursor=cursor):
+                page = paginator.get_page(cursor)
+                self.assertEqual((self.titles(page), page.has_previous), (first, False))
+
+    def test_listings_view_ignores_a_tampered_cursor(self):
+        response = self.client.get('/listings/', {'cursor': encode_cursor(['not a date', 'x'], 'n')})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['listings']), 3)
+        self.assertFalse(response.context['listings'].has_previous)
+
+    def test_id_list_pages_in_list_order(self):
+        ids = list(self.cards.values_list('pk', flat=True))
+        paginator = IdListPaginator(ids, 4, ListingCard.objects.in_bulk)
+        first = paginator.get_page()
+        second = paginator.get_page(first.next_cursor)
+        self.assertEqual([card.pk for card in first] + [card.pk for card in second], ids)
+        self.assertEqual(paginator.get_page(second.previous_cursor).object_list, first.object_list)
+        self.assertEqual(paginator.estimated_total, 6)
+        for cursor in ('garbage', encode_cursor(['x'], 'n'), encode_cursor([10 ** 6], 'p')):
+            with self.subTest(cursor=cursor):
+                self.assertEqual(paginator.get_page(cursor).object_list, first.object_list)
+
+    def test_search_pages_through_every_keyword_hit(self):
+        for listing in Listing.objects.all():
+            search.update_listing(listing)
+        seen, params = [], {'keywords': 'clinic'}
+        while True:
+            page = self.client.get('/listings/search', params).context['listings']
+            seen += [card.pk for card in page]
+            if not page.has_next:
+                break
+            params['cursor'] = page.next_cursor
+        self.assertEqual(sorted(seen), sorted(self.cards.values_list('pk', flat=True)))
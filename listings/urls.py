@@ -7,4 +7,5 @@ urlpatterns = [
     path('', views.listings, name='listings'),
     path('<int:listing_id>', views.listing, name='listing'),
     path('search', views.search, name='search'),
+    path('suggest', views.suggest, name='suggest'),
 ]
\ No newline at end of file
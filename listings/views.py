@@ -1,47 +1,171 @@
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404
-from .models import Listing
-from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.utils.cache import patch_cache_control
+from django.utils.http import urlencode
+from .models import Listing, ListingCard
+from django.db.models import Max
+from doctors.models import Doctor
+from pages.conditional import conditional_page, stamp_version
+from pages.middleware import cache_with_holes
+from pages.microcache import micro_cache
+from .paginator import IdListPaginator, KeysetPaginator
 from .choices import district_choices, room_choices, rooms_choices
-from django.db.models import Q
+from . import search as search_index
+from . import cache as result_cache
+from .facets import facet_filters, search_facets
+from .bitmap import Bitmap, bitmap_index
+from .bm25 import rank_index
+from .postings import intersect, posting_index
+from .suggest import MAX_QUERY, TOP_K, suggest_index
+from .spelling import spelling_index
+def listings_stamp(request):
+    #newest change to any listing or doctor (index-only Max), plus a counter bumped on every listing delete
+    listings = Listing.objects.aggregate(modified=Max('updated_at'))
+    doctors = Doctor.objects.aggregate(modified=Max('updated_at'))
+    modified = max(filter(None, (listings['modified'], doctors['modified'])), default=None)
+    return modified, stamp_version(listings['modified'], result_cache.deletions(Listing), doctors['modified'])
+
+@conditional_page(listings_stamp)
 def listings(request):
-    listings = Listing.objects.order_by('-list_date').filter(is_published=True) 
+    listings = ListingCard.objects.order_by('-list_date').filter(is_published=True) #card rows only, doctor name and photo url included
     #listings = Listing.objects.all()
-    paginator=Paginator(listings, 3)
-    page=request.GET.get('page')
-    paged_listings = paginator.get_page(page) 
+    paginator=KeysetPaginator(listings, 3, keys=('-list_date', '-pk')) #cursor on (list_date, id), no COUNT/OFFSET
+    paged_listings = paginator.get_page(request.GET.get('cursor'))
     context = {'listings': paged_listings} 
     return render(request, 'listings/listings.html', context)
 
+def listing_stamp(request, listing_id):
+    #one primary key lookup, the page is not rendered for a 304
+    stamps = Listing.objects.filter(pk=listing_id).values_list('updated_at', 'doctor__updated_at').first()
+    if stamps is None:
+        return None
+    return max(stamps), stamp_version(*stamps)
+
+@cache_with_holes #one cached page for everyone, csrf / user fields / messages filled per request
+@conditional_page(listing_stamp)
 def listing(request,listing_id):
-    listing = get_object_or_404(Listing, pk=listing_id)
-    context = {'listing':listing}
+    listing = get_object_or_404(Listing.objects.select_related('doctor'), pk=listing_id) #doctor email goes into the inquiry form
+    context = {'listing':listing,
+               'fragment_version': result_cache.listing_version(listing.pk)} #bumped by listings.signals, keys the cached sections
     return render(request, 'listings/listing.html', context)
 
+def keyword_results(keywords):
+    #full-text part of a search, cached on its own so every filter combination reuses it
+    def compute():
+        queryset_list = search_index.search(Listing.objects.filter(is_published=True), keywords) #ranked full-text match on title, doctor, services, professionals, description
+        ids = list(queryset_list.values_list('id', flat=True)) #every hit: ids only, so the last page is as reachable as the first
+        return ids, len(ids)
+    return result_cache.cached_results((('keywords', keywords),), compute)
+
+def keyword_ids(params):
+    #ids of every keyword hit, the base for the facet counts
+    if params.get('sort') == 'relevance':
+        return rank_index.current().matches(params['keywords'])
+    return keyword_results(params['keywords'])[0]
+
+def related_ids(params):
+    #listings carrying every requested service tag and subject, None when not filtering on them
+    index = posting_index.current()
+    postings = [index.lookup(kind, params.getlist(kind)) for kind in ('services', 'professionals') if params.getlist(kind)]
+    return intersect(postings) if postings else None
+
+RANK_WINDOW = 32 #relevance hits heap-selected for the first pages, doubled for each deeper step
+
+def rank_window(cursor, per_page):
+    #enough ranked ids to hold the cursor's page and tell whether another one follows
+    window, needed = RANK_WINDOW, IdListPaginator.offset(cursor) + per_page + 2
+    while window < needed:
+        window *= 2
+    return window
+
+def search_results(params, window=None):
+    index = bitmap_index.current()
+    matching = index.matching(facet_filters(params)) #district / room_type / rooms answered from the in-memory bitmaps
+    related = related_ids(params)
+    if related is not None:
+        matching = matching & Bitmap.from_ids(related)
+    keywords = params.get('keywords')
+    if keywords and params.get('sort') == 'relevance':
+        return rank_index.current().top(keywords, matching, window) #BM25 over the in-process inverted index, heap top-k
+    if keywords:
+        keyword_ids = keyword_results(keywords)[0]
+        ids = [pk for pk in keyword_ids if pk in matching] #keeps the relevance order
+        return ids, len(ids)
+    ids = index.ordered(matching)
+    return ids, len(ids)
+
+AUTOCORRECT_DISTANCE = 1 #closer corrections are applied, further ones only suggested
+
+def corrected_params(params):
+    #keywords with misspelt district / doctor / tag / subject names replaced, a district moves to its filter
+    query = result_cache.as_query(params)
+    keywords = query.get('keywords')
+    if not keywords:
+        return None
+    corrections = spelling_index.current().correct(keywords)
+    text, remaining, district, distance = keywords, keywords, query.get('district'), 0
+    for span, term, kind, span_distance in corrections:
+        text = text.replace(span, term, 1)
+        if kind == 'district' and not district:
+            district, remaining = term, remaining.replace(span, '', 1)
+        else:
+            remaining = remaining.replace(span, term, 1)
+        distance = max(distance, span_distance)
+    query.setlist('keywords', [remaining])
+    query.setlist('district', [district or ''])
+    corrected = result_cache.normalize_params(query)
+    return (corrected, text, distance) if corrected != params else None
+
+def cached_search(params, window):
+    #(ids, total); ranked searches hold only the top `window` ids, so the window is part of the key
+    query = result_cache.as_query(params)
+    if query.get('keywords') and query.get('sort') == 'relevance':
+        return result_cache.cached_results(params + (('window', str(window)),), lambda: search_results(query, window))
+    return result_cache.cached_results(params, lambda: search_results(query))
+
+@micro_cache(ttl=5, stale=30) #anonymous repeats of a query skip even the result cache lookups
 def search(request):
-    queryset_list = Listing.objects.order_by('-list_date')
-    if 'keywords' in request.GET:
-        keywords = request.GET['keywords']
-        if keywords:
-            queryset_list = queryset_list.filter(Q(description__icontains=keywords) | Q(title__icontains=keywords) | Q(doctor__name__icontains=keywords)) #icontains = partially contain
-    if 'district' in request.GET:
-        district = request.GET['district']
-        if district:
-            queryset_list = queryset_list.filter(district__iexact=district) #iexact = accept upper & lower case
-    if 'rooms' in request.GET:
-        rooms = request.GET['rooms']
-        if rooms:
-            queryset_list = queryset_list.filter(rooms__gte=rooms) #lte = less than equal to
-    if 'room_type' in request.GET:
-        room_type = request.GET['room_type']
-        if room_type:
-            queryset_list = queryset_list.filter(room_type__iexact=room_type)
-    paginator=Paginator(queryset_list, 3)
-    page=request.GET.get('page')
-    paged_listings = paginator.get_page(page) 
+    params = result_cache.normalize_params(request.GET) #lower-cased, sorted, empty values dropped
+    query = result_cache.as_query(params)
+    window = rank_window(request.GET.get('cursor'), 3)
+    ids, total = cached_search(params, window)
+    spelling = {}
+    correction = corrected_params(params) if not total else None
+    if correction:
+        corrected, text, distance = correction
+        corrected_query = result_cache.as_query(corrected)
+        corrected_ids, corrected_total = cached_search(corrected, window)
+        if corrected_total and distance <= AUTOCORRECT_DISTANCE:
+            params, query, ids, total = corrected, corrected_query, corrected_ids, corrected_total
+            spelling = {'corrected': text}
+        elif corrected_total:
+            spelling = {'did_you_mean': text, 'did_you_mean_query': urlencode(corrected)}
+    paginator = IdListPaginator(ids, 3, ListingCard.objects.in_bulk, total=total)
+    paged_listings = paginator.get_page(request.GET.get('cursor'))
+    base_ids = keyword_ids(query) if 'keywords' in query else None
+    related = related_ids(query)
+    if related is not None:
+        related_set = set(related)
+        base_ids = related if base_ids is None else [pk for pk in base_ids if pk in related_set]
     context = {'listings': paged_listings,
+               'facets': search_facets(query, base_ids), #option counts from the in-memory bitsets, no SQL
+               'service_choices': posting_index.choices('services'),
+               'professional_choices': posting_index.choices('professionals'),
+               'selected_services': request.GET.getlist('services'),
+               'selected_professionals': request.GET.getlist('professionals'),
                'district_choices': district_choices,
                'room_choices': room_choices,
                'rooms_choices': rooms_choices,
-               'values': request.GET}
+               'values': request.GET,
+               **spelling}
     return render(request, 'listings/search.html', context)
 
+def suggest(request):
+    #typeahead for the search box, answered from the in-memory prefix trie
+    query = request.GET.get('q', '')[:MAX_QUERY]
+    limit = request.GET.get('limit', '')
+    limit = min(int(limit), TOP_K) if limit.isdecimal() else 8
+    response = JsonResponse({'q': query, 'suggestions': suggest_index.current().suggest(query, limit)},
+                            json_dumps_params={'ensure_ascii': False})
+    patch_cache_control(response, public=True, max_age=60)
+    return response
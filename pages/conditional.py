@@ -0,0 +1,54 @@
+"""Conditional GET (ETag / Last-Modified) for the public pages.
+
+Like django.views.decorators.http.condition, but both validators come from a
+single ``stamp_func`` call (one indexed lookup) and they are safe for pages
+that also show the navbar and flash messages: the ETag carries the user id,
+and a request with pending messages always gets the full page so they are
+not lost behind a 304.
+"""
+from functools import wraps
+
+from django.contrib import messages
+from django.utils.cache import get_conditional_response, patch_vary_headers, quote_etag
+from django.utils.http import http_date
+
+
+def stamp_version(*stamps):
+    """ETag part for a mix of datetimes (None allowed) and counters."""
+    return '.'.join(str(int(stamp.timestamp() * 1000000)) if hasattr(stamp, 'timestamp') else str(stamp or 0)
+                    for stamp in stamps)
+
+
+def page_etag(request, version):
+    return quote_etag('%s-%s' % (version, request.user.pk or 0))
+
+
+def set_validators(response, request, version, last_modified):
+    """ETag and Last-Modified for ``request``; kept on ``response.page_validators`` for the page cache."""
+    response.headers.setdefault('ETag', page_etag(request, version))
+    response.headers.setdefault('Last-Modified', http_date(last_modified))
+    patch_vary_headers(response, ('Cookie',))
+    response.page_validators = (version, last_modified)
+
+
+def conditional_page(stamp_func):
+    """``stamp_func(request, *args, **kwargs)`` returns ``(last modified, version)`` or None."""
+    def decorator(view):
+        @wraps(view)
+        def inner(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or len(messages.get_messages(request)):
+                return view(request, *args, **kwargs)
+            stamp = stamp_func(request, *args, **kwargs)
+            if stamp is None or stamp[0] is None:
+                return view(request, *args, **kwargs)
+            modified, version = stamp
+            etag = page_etag(request, version)
+            last_modified = int(modified.timestamp())
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                set_validators(response, request, version, last_modified)
+            return response
+        return inner
+    return decorator
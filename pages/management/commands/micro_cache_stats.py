@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from pages.microcache import counters, reset_counters
+
+
+class Command(BaseCommand):
+    help = 'Print the micro-cache hit / stale / miss counters (each worker adds its own every FLUSH_SECONDS)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Zero the counters after printing them')
+
+    def handle(self, *args, **options):
+        counts = counters()
+        total = sum(counts.values())
+        for name, value in counts.items():
+            self.stdout.write('%-6s %8d  %5.1f%%' % (name, value, 100.0 * value / total if total else 0))
+        if options['reset']:
+            reset_counters()
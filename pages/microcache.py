@@ -0,0 +1,171 @@
+"""Micro-cache for anonymous GETs of hot pages (home page, search).
+
+Views marked with ``micro_cache`` keep their rendered HTML for a few seconds.
+Once an entry is past its TTL it stays usable for ``stale`` more seconds:
+the first request to see it stale takes a per-key lock (``cache.add``, so
+only one worker wins) and renders a fresh copy, while everyone else keeps
+getting the stale one. With no copy at all, requests that lose the lock wait
+briefly for the winner instead of all rendering the same page: on an event
+when the winner is in the same process, otherwise polling with backoff until
+the lock is gone.
+
+Entries are keyed on the listing data version too (listings.cache), so a
+committed edit is never answered from a copy rendered before it, not even a
+stale one.
+
+Responses carry ``X-Micro-Cache: HIT|STALE|MISS``. The counts are kept per
+process and added to the shared cache at most every FLUSH_SECONDS, so a hit
+costs no shared write (see the micro_cache_stats command).
+"""
+import hashlib
+import threading
+import time
+from collections import Counter
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+
+from listings.cache import data_version
+
+COUNTERS = ('hit', 'stale', 'miss')
+COUNTER_KEY = 'pages:micro:count:%s'
+LOCK_TIMEOUT = 30    # a crashed recompute frees its key after this
+WAIT_SECONDS = 2     # how long a request without a stale copy waits for the winner
+WAIT_STEP = 0.01     # first poll for a winner in another process, doubled up to MAX_WAIT_STEP
+MAX_WAIT_STEP = 0.2
+FLUSH_SECONDS = 10
+
+_counts = Counter()
+_flushed = time.monotonic()
+_counts_lock = threading.Lock()
+_rendering = {}      # entry key -> Event set when this process's winner is done
+
+
+def micro_cache(ttl=5, stale=30):
+    def decorator(view):
+        view.micro_cache = (ttl, stale)
+        return view
+    return decorator
+
+
+def count(name):
+    global _flushed
+    with _counts_lock:
+        _counts[name] += 1
+        if time.monotonic() - _flushed < FLUSH_SECONDS:
+            return
+        pending = dict(_counts)
+        _counts.clear()
+        _flushed = time.monotonic()
+    add_counts(pending)
+
+
+def add_counts(counts):
+    for name, value in counts.items():
+        key = COUNTER_KEY % name
+        try:
+            cache.incr(key, value)
+        except ValueError:
+            cache.add(key, 0, None)
+            cache.incr(key, value)
+
+
+def flush_counters():
+    global _flushed
+    with _counts_lock:
+        pending = dict(_counts)
+        _counts.clear()
+        _flushed = time.monotonic()
+    add_counts(pending)
+
+
+def counters():
+    """Counts of every process up to its last flush, plus this process's unflushed ones."""
+    values = cache.get_many([COUNTER_KEY % name for name in COUNTERS])
+    with _counts_lock:
+        return {name: values.get(COUNTER_KEY % name, 0) + _counts[name] for name in COUNTERS}
+
+
+def reset_counters():
+    global _flushed
+    with _counts_lock:
+        _counts.clear()
+        _flushed = time.monotonic()
+    cache.delete_many([COUNTER_KEY % name for name in COUNTERS])
+
+
+def entry_key(request):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return 'pages:micro:%s:%s' % (data_version(), digest)
+
+
+def cached_response(entry, state):
+    content, content_type, fresh_until = entry
+    response = HttpResponse(content, content_type=content_type)
+    response['X-Micro-Cache'] = state
+    count(state.lower())
+    return response
+
+
+class MicroCacheMiddleware:
+    """Must sit after the auth and messages middleware (anonymous, no pending messages)."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            response = self.get_response(request)
+            settings = getattr(request, 'micro_cache', None)
+            if settings is not None and response.status_code == 200 and not response.streaming:
+                key, ttl, stale = settings
+                entry = (response.content, response['Content-Type'], time.time() + ttl)
+                cache.set(key, entry, ttl + stale)
+                response['X-Micro-Cache'] = 'MISS'
+                count('miss')
+            return response
+        finally:
+            if getattr(request, 'micro_cache_lock', None):
+                cache.delete(request.micro_cache_lock)
+                _rendering.pop(request.micro_cache[0], threading.Event()).set()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        settings = getattr(view_func, 'micro_cache', None)
+        if settings is None or request.method not in ('GET', 'HEAD'):
+            return None
+        if request.user.is_authenticated or len(messages.get_messages(request)):
+            return None
+        ttl, stale = settings
+        key = entry_key(request)
+        entry = cache.get(key)
+        if entry is not None and entry[2] > time.time():
+            return cached_response(entry, 'HIT')
+        lock = key + ':lock'
+        if cache.add(lock, 1, LOCK_TIMEOUT):
+            # this request recomputes; __call__ stores the result and frees the lock
+            request.micro_cache, request.micro_cache_lock = (key, ttl, stale), lock
+            _rendering[key] = threading.Event()
+            return None
+        if entry is not None:
+            return cached_response(entry, 'STALE')
+        entry = self.wait(key, lock)
+        if entry is not None:
+            return cached_response(entry, 'HIT')
+        request.micro_cache = (key, ttl, stale)
+        return None
+
+    def wait(self, key, lock):
+        """The winner's entry, or None once it failed or WAIT_SECONDS passed."""
+        event = _rendering.get(key)
+        if event is not None:
+            event.wait(WAIT_SECONDS)
+            return cache.get(key)
+        deadline, step = time.monotonic() + WAIT_SECONDS, WAIT_STEP
+        while time.monotonic() < deadline:
+            time.sleep(min(step, max(0, deadline - time.monotonic())))
+            step = min(step * 2, MAX_WAIT_STEP)
+            entry = cache.get(key)
+            if entry is not None or cache.get(lock) is None:
+                return entry
+        return None
@@ -0,0 +1,92 @@
+"""Full-page cache with per-request holes.
+
+Views marked with ``cache_with_holes`` are rendered once per URL and data
+version with every ``{% hole %}`` left as a placeholder comment; that HTML is
+cached and shared by all visitors. Each response is then completed by
+rendering just the holes (navbar, flash messages, CSRF token, the user's
+inquiry fields) for the current request. The page's validators (see
+pages.conditional) are cached with it, so a hit carries the same ETag and
+Last-Modified as a fresh render and the next visit can end in a 304.
+
+Must sit after the auth and messages middleware so holes see ``request.user``
+and consume messages, and inside CsrfViewMiddleware so a token issued while
+filling a hole still gets its cookie.
+"""
+import hashlib
+import re
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse
+from django.template.loader import render_to_string
+from django.utils.cache import patch_cache_control
+
+from listings.cache import data_version
+from pages.conditional import set_validators
+
+HOLE = '<!--hole %s-->'
+HOLE_RE = re.compile(r'<!--hole (partials/[\w./-]+)-->')
+PAGE_TIMEOUT = 60 * 10
+
+
+def cache_with_holes(view):
+    view.cache_with_holes = True
+    return view
+
+
+def page_key(request):
+    digest = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return 'pages:page:%s:%s' % (data_version(), digest)
+
+
+def fill_holes(content, request):
+    rendered = {}
+
+    def render(match):
+        name = match.group(1)
+        if name not in rendered:
+            rendered[name] = render_to_string(name, request=request)
+        return rendered[name]
+    return HOLE_RE.sub(render, content)
+
+
+class HolePunchedCacheMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        key = getattr(request, 'page_cache_key', None)
+        if key is None:
+            return response
+        request.punch_holes = False
+        if response.status_code == 200 and not response.streaming and response['Content-Type'].startswith('text/html'):
+            content = response.content.decode(response.charset)
+            validators = getattr(response, 'page_validators', None)
+            cache.set(key, (content, response['Content-Type'], validators), PAGE_TIMEOUT)
+            response.content = fill_holes(content, request)
+            response['X-Page-Cache'] = 'MISS'
+            patch_cache_control(response, private=True)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(view_func, 'cache_with_holes', False) or request.method not in ('GET', 'HEAD'):
+            return None
+        if 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers:
+            # revalidation: let the view's conditional check answer 304 without rendering
+            return None
+        key = page_key(request)
+        cached = cache.get(key)
+        if cached is None:
+            request.page_cache_key = key
+            request.punch_holes = True
+            return None
+        content, content_type, validators = cached
+        # like conditional_page: no validators while messages are pending, they must not hide behind a 304
+        pending = len(messages.get_messages(request))
+        response = HttpResponse(fill_holes(content, request), content_type=content_type)
+        response['X-Page-Cache'] = 'HIT'
+        if validators is not None and not pending:
+            set_validators(response, request, *validators)
+        patch_cache_control(response, private=True)
+        return response
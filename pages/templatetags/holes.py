@@ -0,0 +1,19 @@
+from django import template
+from django.utils.safestring import mark_safe
+
+from pages.middleware import HOLE
+
+register = template.Library()
+
+
+@register.simple_tag(takes_context=True)
+def hole(context, template_name):
+    """Include ``template_name``, or leave a placeholder for the page cache to fill.
+
+    A hole is rendered from the request alone (user, messages, CSRF token), so
+    it must not rely on variables passed in by the view.
+    """
+    request = context.get('request')
+    if getattr(request, 'punch_holes', False):
+        return mark_safe(HOLE % template_name)
+    return context.template.engine.get_template(template_name).render(context)
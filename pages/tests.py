@@ -1,3 +1,215 @@
-from django.test import TestCase
+import re
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import Client, TestCase, override_settings
+
+from config import testing
+from pages import microcache
+from doctors.models import Doctor
+from listings.models import Listing
+
+
+@override_settings(CACHES=testing.CACHES)
+class ConditionalPageTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.doctors = [Doctor.objects.create(name='Dr %d' % i, email='dr%d@example.com' % i, photo='doctors/%d.png' % i)
+                       for i in range(2)]
+        cls.listings = [Listing.objects.create(
+            doctor=cls.doctors[1], title='Clinic %d' % i, address='Road %d' % i, district='Wan Chai',
+            room_type='Private Rooms', service=1, screen=1, professional=1, rooms='2',
+            photo_main='photos/clinic.png', is_published=True) for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def assertDeletionChangesETag(self, url, instance):
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        with self.captureOnCommitCallbacks(execute=True):
+            instance.delete()  # not the newest row, so Max(updated_at) stays put
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_about_etag_changes_when_a_doctor_is_deleted(self):
+        self.assertDeletionChangesETag('/about', self.doctors[0])
+
+    def test_listings_etag_changes_when_a_listing_is_deleted(self):
+        self.assertDeletionChangesETag('/listings/', self.listings[0])
+
+    def test_page_cache_hits_carry_the_validators(self):
+        url = '/listings/%d' % self.listings[0].pk
+        miss, hit = self.client.get(url), self.client.get(url)
+        self.assertEqual((miss['X-Page-Cache'], hit['X-Page-Cache']), ('MISS', 'HIT'))
+        self.assertEqual((hit['ETag'], hit['Last-Modified']), (miss['ETag'], miss['Last-Modified']))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=hit['ETag']).status_code, 304)
+
+        user = User.objects.create_user('visitor', 'visitor@example.com', 'secret')
+        self.client.force_login(user)
+        hit = self.client.get(url)
+        self.assertEqual(hit['X-Page-Cache'], 'HIT')
+        self.assertEqual(hit['ETag'], miss['ETag'].replace('-0"', '-%d"' % user.pk))  # per user, like a fresh render
+
+
+@override_settings(CACHES=testing.CACHES)
+class PageCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        doctor = Doctor.objects.create(name='Dr Ho', email='ho@example.com', photo='doctors/ho.png')
+        cls.listing = Listing.objects.create(
+            doctor=doctor, title='Harbour Clinic', address='1 Road', district='Wan Chai', room_type='Private Rooms',
+            service=1, screen=1, professional=1, rooms='2', photo_main='photos/clinic.png', is_published=True)
+        cls.alice = User.objects.create_user('alice', 'alice@example.com', 'secret', first_name='Alice')
+        cls.bob = User.objects.create_user('bob', 'bob@example.com', 'secret', first_name='Bob')
+
+    def setUp(self):
+        cache.clear()
+        self.url = '/listings/%d' % self.listing.pk
+
+    def get(self, client=None, **headers):
+        return (client or self.client).get(self.url, headers=headers)
+
+    def logged_in(self, user):
+        client = Client()
+        client.force_login(user)
+        return client
+
+    def test_miss_then_hit(self):
+        miss, hit = self.get(), self.get()
+        self.assertEqual((miss['X-Page-Cache'], hit['X-Page-Cache']), ('MISS', 'HIT'))
+        token = re.compile(rb'name="csrfmiddlewaretoken" value="[^"]+"')  # masked afresh on every response
+        self.assertEqual(token.sub(b'', miss.content), token.sub(b'', hit.content))
+        self.assertContains(hit, 'Harbour Clinic')
+        self.assertIn('private', hit['Cache-Control'])
+        self.assertNotIn(b'<!--hole', hit.content)
+
+    def test_user_fields_never_reach_another_visitor(self):
+        alice = self.get(self.logged_in(self.alice))
+        self.assertEqual(alice['X-Page-Cache'], 'MISS')
+        self.assertContains(alice, 'alice@example.com')
+        self.assertContains(alice, 'Welcome alice')
+
+        bob, anonymous = self.get(self.logged_in(self.bob)), self.get()
+        self.assertEqual((bob['X-Page-Cache'], anonymous['X-Page-Cache']), ('HIT', 'HIT'))
+        self.assertContains(bob, 'bob@example.com')
+        self.assertContains(bob, 'value="%d"' % self.bob.pk)
+        for response in (bob, anonymous):
+            self.assertNotContains(response, 'alice')
+        self.assertNotContains(anonymous, 'bob@example.com')
+
+    def test_hit_issues_a_csrf_cookie_and_token(self):
+        self.get()
+        client = Client(enforce_csrf_checks=True)
+        response = self.get(client)
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertIn('csrftoken', response.cookies)
+        token = re.search(rb'name="csrfmiddlewaretoken" value="([^"]+)"', response.content).group(1).decode()
+        posted = client.post('/accounts/login', {'username': 'alice', 'password': 'wrong', 'csrfmiddlewaretoken': token})
+        self.assertEqual(posted.status_code, 302)  # past the CSRF check
+
+    def test_pending_messages_fill_the_alert_hole(self):
+        self.get()
+        self.client.post('/accounts/login', {'username': 'alice', 'password': 'wrong'})
+        response = self.get()
+        self.assertEqual(response['X-Page-Cache'], 'HIT')
+        self.assertContains(response, 'Invalid credentials')
+        self.assertNotIn('ETag', response)  # a 304 would lose the message
+        self.assertNotContains(self.get(), 'Invalid credentials')
+
+    def test_revalidation_skips_the_cache(self):
+        etag = self.get()['ETag']
+        with mock.patch('pages.middleware.page_key') as page_key:
+            response = self.get(if_none_match=etag)
+            stale = self.get(if_none_match='"other"')
+        page_key.assert_not_called()
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(stale.status_code, 200)
+        self.assertNotIn('X-Page-Cache', stale)
+
+
+@override_settings(CACHES=testing.CACHES)
+class MicroCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        microcache.reset_counters()
+
+    def get(self):
+        return self.client.get('/')
+
+    def entry_key(self):
+        return microcache.entry_key(self.get().wsgi_request)
+
+    def test_miss_then_hit(self):
+        first, second = self.get(), self.get()
+        self.assertEqual((first['X-Micro-Cache'], second['X-Micro-Cache']), ('MISS', 'HIT'))
+        self.assertEqual(first.content, second.content)
+
+    def test_stale_copy_is_served_while_another_worker_refreshes(self):
+        key = self.entry_key()
+        content, content_type, _ = cache.get(key)
+        cache.set(key, (content, content_type, time.time() - 1))
+        cache.add(key + ':lock', 1)
+        self.assertEqual(self.get()['X-Micro-Cache'], 'STALE')
+        cache.delete(key + ':lock')
+        self.assertEqual(self.get()['X-Micro-Cache'], 'MISS')  # this one refreshes
+        self.assertIsNone(cache.get(key + ':lock'))
+        self.assertEqual(self.get()['X-Micro-Cache'], 'HIT')
+
+    def test_waiter_renders_once_the_other_worker_gives_up(self):
+        key = self.entry_key()
+        cache.delete(key)
+        cache.add(key + ':lock', 1)
+        sleeps = []
+
+        def sleep(seconds):
+            sleeps.append(seconds)
+            if len(sleeps) == 3:
+                cache.delete(key + ':lock')  # the winner failed without storing anything
+
+        with mock.patch('pages.microcache.time.sleep', sleep):
+            self.assertEqual(self.get()['X-Micro-Cache'], 'MISS')
+        self.assertEqual(sleeps, [microcache.WAIT_STEP, microcache.WAIT_STEP * 2, microcache.WAIT_STEP * 4])
+
+    def test_waiter_takes_the_winners_entry(self):
+        key = self.entry_key()
+        entry = cache.get(key)
+        cache.delete(key)
+        cache.add(key + ':lock', 1)
+        with mock.patch('pages.microcache.time.sleep', lambda seconds: cache.set(key, entry)):
+            self.assertEqual(self.get()['X-Micro-Cache'], 'HIT')
+
+    def test_committed_edits_are_never_served_from_an_older_copy(self):
+        listing = Listing.objects.create(
+            doctor=Doctor.objects.create(name='Dr Ho', email='ho@example.com', photo='doctors/ho.png'),
+            title='Harbour Clinic', address='1 Road', district='Sha Tin', room_type='Private Rooms', service=1,
+            screen=1, professional=1, rooms='2', photo_main='photos/clinic.png', is_published=True)
+        search = lambda: self.client.get('/listings/search', {'district': 'Sha Tin'})
+        self.assertContains(search(), 'Harbour Clinic')
+        self.assertEqual(search()['X-Micro-Cache'], 'HIT')
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.is_published = False
+            listing.save()
+        response = search()
+        self.assertEqual(response['X-Micro-Cache'], 'MISS')
+        self.assertNotContains(response, 'Harbour Clinic')
+
+    def test_counters_are_kept_in_process_until_flushed(self):
+        microcache.reset_counters()
+        with mock.patch('pages.microcache.cache.incr') as incr:
+            self.get()
+            self.get()
+            self.get()
+        incr.assert_not_called()
+        self.assertEqual(microcache.counters(), {'hit': 2, 'stale': 0, 'miss': 1})
+        microcache.flush_counters()
+        self.assertEqual(cache.get(microcache.COUNTER_KEY % 'hit'), 2)
+        self.assertEqual(microcache.counters(), {'hit': 2, 'stale': 0, 'miss': 1})
+        with mock.patch('pages.microcache.time.monotonic', return_value=time.monotonic() + microcache.FLUSH_SECONDS):
+            self.get()
+        self.assertEqual(cache.get(microcache.COUNTER_KEY % 'hit'), 3)
+        microcache.reset_counters()
+        self.assertEqual(microcache.counters(), {'hit': 0, 'stale': 0, 'miss': 0})
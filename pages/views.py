@@ -1,10 +1,15 @@
 from django.shortcuts import render
+from django.db.models import Max
+from pages.conditional import conditional_page, stamp_version
+from pages.microcache import micro_cache
 # Create your views here.
-from listings.models import Listing
+from listings.models import ListingCard
 from doctors.models import Doctor #imported the doctor model from doctors app
+from listings.cache import deletions
 from listings.choices import district_choices, room_choices, rooms_choices
+@micro_cache(ttl=5, stale=30) #anonymous visitors share one render, refreshed by a single request
 def index(request):
-    listings = Listing.objects.filter(is_published=True)[:3]
+    listings = ListingCard.objects.filter(is_published=True)[:3] #denormalized cards, one query for the whole row
     context = {'listings': listings,
                'district_choices': district_choices,
                'room_choices': room_choices,
@@ -12,6 +17,12 @@ def index(request):
                }
     return render(request, 'pages/index.html', context)
 
+def about_stamp(request):
+    #the deletion counter stands in for a COUNT(*) per request
+    doctors = Doctor.objects.aggregate(modified=Max('updated_at'))
+    return doctors['modified'], stamp_version(doctors['modified'], deletions(Doctor))
+
+@conditional_page(about_stamp)
 def about(request):
     doctors = Doctor.objects.order_by('-hire_date')[:3]
     mvp_doctors = Doctor.objects.all().filter(is_mvp=True)